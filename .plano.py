@@ -17,4 +17,131 @@
 # under the License.
 #
 
+import sys
+
 from skewer.planocommands import *
+
+@command(parameters=[CommandParameter("port", help="The frontend port"),
+                     CommandParameter("latency", help="The mean one-way delay of the hop in seconds"),
+                     CommandParameter("jitter", help="The spread of the delay in seconds"),
+                     CommandParameter("distribution",
+                                      help="The delay distribution: constant, uniform, normal, or exponential"),
+                     CommandParameter("bandwidth", type=int, help="The throughput cap in bytes per second (0 for none)"),
+                     CommandParameter("failure_rate", type=float,
+                                      help="The chance that each chunk of data drops its connection"),
+                     CommandParameter("seed", type=int, help="Seed the random choices for repeatable runs")])
+def run_wan(port=8080, latency=0.05, jitter=0.01, distribution="normal", bandwidth=0, failure_rate=0.0, seed=None):
+    """
+    Run the frontend and backend locally with a simulated WAN hop between them
+    """
+    from skewer.proxy import WanProxy
+
+    backend_port = get_random_port()
+    proxy_port = get_random_port()
+
+    with working_dir("backend"):
+        backend = start(f"{sys.executable} python/main.py --host localhost --port {backend_port}")
+
+    try:
+        await_port(backend_port)
+
+        with WanProxy(proxy_port, backend_port, latency=latency, jitter=jitter, distribution=distribution,
+                      bandwidth=bandwidth, failure_rate=failure_rate, seed=seed) as proxy:
+            with working_dir("frontend"):
+                frontend = start(f"{sys.executable} python/main.py --host localhost --port {port} "
+                                 f"--backend http://localhost:{proxy_port}")
+
+            try:
+                await_port(port)
+
+                notice(f"Frontend: http://localhost:{port}/ (backend via {proxy})")
+
+                wait(frontend)
+            finally:
+                stop(frontend)
+
+                notice(f"The proxy handled {proxy.connections} connections and dropped "
+                       f"{proxy.dropped_connections}")
+    finally:
+        stop(backend)
+
+@command(passthrough=True)
+def test_frontend(passthrough_args=[]):
+    """
+    Run the frontend unit tests
+    """
+    sys.path.insert(0, get_absolute_path("frontend/python"))
+
+    import tests
+
+    PlanoTestCommand(tests).main(args=passthrough_args)
+
+@command(parameters=[CommandParameter("runs", help="The number of times to start each image")])
+def measure_startup(runs=5):
+    """
+    Report the time from starting each image to its first successful /api/health
+    """
+    backend_image = "quay.io/skupper/hello-world-backend"
+    frontend_image = "quay.io/skupper/hello-world-frontend"
+    backend_port = get_random_port()
+    frontend_port = get_random_port()
+
+    backend_command = f"podman run --rm --net host {backend_image} --host localhost --port {backend_port}"
+    frontend_command = (f"podman run --rm --net host {frontend_image} --host localhost --port {frontend_port} "
+                        f"--backend http://localhost:{backend_port}")
+
+    # Pull the images first so the first run doesn't time the download
+    for image in (backend_image, frontend_image):
+        run(f"podman pull {image}")
+
+    results = list()
+
+    results.append((backend_image, [time_to_health(backend_command, backend_port) for _ in range(runs)]))
+
+    # The frontend health check calls the backend
+    backend = start(backend_command)
+
+    try:
+        await_health(backend_port)
+
+        results.append((frontend_image, [time_to_health(frontend_command, frontend_port) for _ in range(runs)]))
+    finally:
+        stop(backend)
+
+    print()
+    print("{:<40}  {:>8}  {:>8}  {:>8}".format("Image", "Min", "Median", "Max"))
+
+    for image, times in results:
+        times.sort()
+        print("{:<40}  {:>7.3f}s  {:>7.3f}s  {:>7.3f}s".format(image, times[0], times[len(times) // 2], times[-1]))
+
+    print()
+
+def time_to_health(command, port):
+    start_time = get_time()
+    proc = start(command)
+
+    try:
+        await_health(port)
+        return get_time() - start_time
+    finally:
+        stop(proc)
+
+def await_health(port, timeout=60):
+    import urllib.request
+
+    url = f"http://localhost:{port}/api/health"
+    deadline = get_time() + timeout
+
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+
+        if get_time() >= deadline:
+            fail(f"Timed out waiting for {url}")
+
+        sleep(0.01, quiet=True)
@@ -19,6 +19,7 @@
 
 import argparse
 import os
+import socket
 import thingid
 import uvicorn
 
@@ -40,6 +41,7 @@ async def hello(request):
     response_data = {
         "text": f"Hi, {requestor}.  I am {name} ({pod}).",
         "name": name,
+        "pod": pod,
     }
 
     return JSONResponse(response_data)
@@ -55,4 +57,11 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
-    uvicorn.run(star, host=args.host, port=args.port)
+    # Bind the socket before the server starts up, so early
+    # connections wait in the backlog instead of being refused
+    family = socket.AF_INET6 if ":" in args.host else socket.AF_INET
+    sock = socket.create_server((args.host, args.port), family=family, backlog=2048)
+
+    config = uvicorn.Config(star, host=args.host, port=args.port)
+
+    uvicorn.Server(config).run(sockets=[sock])
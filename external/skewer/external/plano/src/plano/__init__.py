@@ -17,8 +17,14 @@
 # under the License.
 #
 
+import time as _time
+
+_import_start_time = _time.perf_counter()
+
 from .main import *
 from .main import _default_sigterm_handler
 
 from .command import *
 from .test import *
+
+_import_time = _time.perf_counter() - _import_start_time
@@ -64,6 +64,30 @@ def archive_operations():
         assert is_dir("something-else"), list_dir()
         assert is_file("something-else/some-file"), list_dir("something-else")
 
+        rename_archive("something-else.tar.gz", "something-else")
+        assert is_file("something-else.tar.gz"), list_dir()
+
+    with working_dir():
+        # Enough data for several compressed chunks
+        content = "".join(f"{i} {get_unique_id()}\n" for i in range(100000))
+
+        write("big-dir/big-file", content)
+        make_link("big-dir/big-link", "big-file")
+        make_dir("big-dir/empty-dir")
+
+        make_archive("big-dir", output_file="archives/big-dir.tar.gz", jobs=4)
+        rename_archive("archives/big-dir.tar.gz", "huge-dir", jobs=4)
+        assert not exists("archives/big-dir.tar.gz"), list_dir("archives")
+
+        extract_archive("archives/huge-dir.tar.gz", output_dir="output")
+        assert read("output/huge-dir/big-file") == content
+        assert read_link("output/huge-dir/big-link") == "big-file"
+        assert is_dir("output/huge-dir/empty-dir"), list_dir("output/huge-dir")
+
+        if which("tar"):
+            result = call("tar -tzf archives/huge-dir.tar.gz")
+            assert "huge-dir/big-file" in result, result
+
 @test
 def command_operations():
     class SomeCommand(BaseCommand):
@@ -342,6 +366,22 @@ def file_operations():
         assert not exists(iota_file)
         assert read(theta_file) == "iota"
 
+        kappa_dir = make_dir("kappa-dir")
+        make_dir(join(kappa_dir, "empty-dir"))
+        make_link(join(kappa_dir, "dir-link"), "empty-dir")
+
+        for i in range(10):
+            write(join(kappa_dir, "sub-dir", f"file-{i}"), str(i) * 1000)
+
+        copied_dir = copy(kappa_dir, "lambda-dir", jobs=4)
+        assert is_dir(join(copied_dir, "empty-dir")), list_dir(copied_dir)
+        assert is_link(join(copied_dir, "dir-link")), list_dir(copied_dir)
+        assert read(join(copied_dir, "sub-dir", "file-7")) == "7" * 1000
+
+        copied_dir = copy(kappa_dir, "mu-dir", symlinks=False)
+        assert not is_link(join(copied_dir, "dir-link")), list_dir(copied_dir)
+        assert is_dir(join(copied_dir, "dir-link")), list_dir(copied_dir)
+
 @test
 def github_operations():
     result = convert_github_markdown("# Hello, Fritz")
@@ -503,6 +543,27 @@ def io_operations():
         assert output_lines[-1] == post_lines[0], (output_lines[-1], post_lines[0])
         assert tailed_lines[0] == post_lines[0], (tailed_lines[0], post_lines[0])
 
+        result = tail_lines(file_b, 0)
+        assert result == [], result
+
+        file_big = write_lines("big", [f"line-{i}\n" for i in range(100000)])
+        result = tail_lines(file_big, 3)
+        assert result == ["line-99997\n", "line-99998\n", "line-99999\n"], result
+
+        result = tail_lines(file_big, 20000)
+        assert result == read_lines(file_big)[-20000:]
+
+        file_no_newline = write("no-newline", "alpha\nbeta")
+        result = tail_lines(file_no_newline, 1)
+        assert result == ["beta"], result
+
+        _os.chmod(file_b, 0o750)
+        link_b = make_link("link-b", file_b)
+        prepend_lines(link_b, ["first\n"])
+        assert is_link(link_b)
+        assert read_lines(file_b)[0] == "first\n"
+        assert _os.stat(file_b).st_mode & 0o777 == 0o750
+
         file_c = touch("c")
         assert is_file(file_c), file_c
 
@@ -600,6 +661,79 @@ def logging_operations():
         with logging_context("boop"):
             error("It's alarming!")
 
+    with working_dir():
+        with logging_enabled(output="json.log", format="json"):
+            with logging_context("alpha"):
+                notice("Path {!r}", "x")
+
+        record = read_json("json.log")
+
+        assert record["level"] == "notice", record
+        assert record["message"] == "Path 'x'", record
+        assert record["contexts"] == ["alpha"], record
+        assert record["program"] == get_program_name(), record
+        assert isinstance(record["time"], float), record
+
+        with logging_enabled(output="buffered.log", buffered=True):
+            notice("One")
+            notice("Two")
+            flush()
+
+            assert "Two" in read("buffered.log")
+
+            notice("Three")
+
+        assert "Three" in read("buffered.log")
+
+        # Threads logging at once lose no messages
+        def log_many(name):
+            for i in range(2000):
+                notice("{} {}", name, i)
+
+        with logging_enabled(output="threads.log", buffered=True):
+            threads = [_threading.Thread(target=log_many, args=(x,)) for x in "abcd"]
+
+            for thread in threads:
+                thread.start()
+
+            for thread in threads:
+                thread.join()
+
+        assert len(read_lines("threads.log")) == 8000, len(read_lines("threads.log"))
+
+    class Expensive:
+        calls = 0
+
+        def __str__(self):
+            Expensive.calls += 1
+            return "expensive"
+
+    with logging_enabled(level="warning"):
+        debug("Suppressed {}", Expensive())
+
+    assert Expensive.calls == 0, Expensive.calls
+
+    with expect_output(contains="expensive") as out:
+        with logging_enabled(level="debug", output=out):
+            debug("Shown {}", Expensive())
+
+    assert Expensive.calls == 1, Expensive.calls
+
+    def log_in_thread():
+        with logging_context("worker"):
+            notice("From a thread")
+
+    with expect_output() as out:
+        with logging_enabled(output=out):
+            with logging_context("main"):
+                thread = _threading.Thread(target=log_in_thread)
+                thread.start()
+                thread.join()
+
+        result = read(out)
+        assert "worker: From a thread" in result, result
+        assert "main:" not in result, result
+
 @test
 def path_operations():
     abspath = _os.path.abspath
@@ -785,6 +919,16 @@ def process_operations():
     run("echo hello | cat", shell=True)
     run(["echo", "hello"], shell=True)
 
+    env = dict(ENV, PLANO_TEST_VALUE="alpha")
+
+    result = call("echo $PLANO_TEST_VALUE", shell=True, env=env)
+    assert result == "alpha\n", result
+    assert "PLANO_TEST_VALUE" not in ENV
+
+    lines = list()
+    run("echo $PLANO_TEST_VALUE", shell=True, line_handler=lines.append, env=env)
+    assert lines == ["alpha\n"], lines
+
     with expect_error():
         run("/not/there")
 
@@ -802,6 +946,40 @@ def process_operations():
     with expect_error():
         call("cat /whoa/not/really")
 
+    lines = list()
+    run("printf 'alpha\\nbeta\\n'", line_handler=lines.append)
+    assert lines == ["alpha\n", "beta\n"], lines
+
+    lines = list()
+    run("cat", input="gamma\n", line_handler=lines.append)
+    assert lines == ["gamma\n"], lines
+
+    try:
+        run("seq 1 1000; exit 3", shell=True, line_handler=lambda x: None, tail_lines=2)
+        assert False # pragma: nocover
+    except PlanoProcessError as e:
+        assert e.returncode == 3, e.returncode
+        assert e.output == "999\n1000\n", e.output
+
+    result = list(stream_lines("seq 1 3"))
+    assert result == ["1\n", "2\n", "3\n"], result
+
+    for line in stream_lines("seq 1 100000"):
+        break
+
+    with expect_error():
+        list(stream_lines("cat /whoa/not/really"))
+
+    procs = run_many(["echo alpha", "echo beta", "cat /whoa/not/really"], jobs=2, check=False)
+    assert [x.exit_code for x in procs] == [0, 0, 1], procs
+    assert procs[1].stdout_result == "beta\n", procs[1].stdout_result
+    assert procs[0].elapsed_time >= 0, procs[0].elapsed_time
+
+    run_many(["echo alpha | cat"], shell=True)
+
+    with expect_error():
+        run_many(["echo alpha", "cat /whoa/not/really"])
+
     proc = start("sleep 10")
 
     if not WINDOWS:
@@ -1021,6 +1199,34 @@ def test_operations():
                 with expect_error():
                     run_tests(chucker.tests, enable="system-exit", verbose=verbose)
 
+            cache_file = get_absolute_path("test-cache.json")
+
+            run_tests(chucker.tests, changed_only=True, cache_file=cache_file)
+
+            result = read_json(cache_file)
+            assert "chucker.tests:hello" in result["tests"], result
+
+            with expect_output(contains="UNCHANGED") as out:
+                with output_redirected(out, quiet=True):
+                    run_tests(chucker.tests, changed_only=True, cache_file=cache_file)
+
+            append("src/chucker/tests.py", "\n")
+
+            with expect_output() as out:
+                with output_redirected(out, quiet=True):
+                    run_tests(chucker.tests, changed_only=True, cache_file=cache_file)
+
+                assert "UNCHANGED" not in read(out), read(out)
+
+            with expect_error():
+                run_tests(chucker.tests, enable="*badbye*", changed_only=True, cache_file=cache_file)
+
+            result = read_json(cache_file)
+            assert "chucker.tests:badbye" not in result["tests"], result
+
+            write(cache_file, "garbage")
+            run_tests(chucker.tests, changed_only=True, cache_file=cache_file, quiet=True)
+
             with expect_system_exit():
                 PlanoTestCommand().main(["--module", "nosuchmodule"])
 
@@ -1123,6 +1329,43 @@ def time_operations():
             with Timer(timeout=TINY_INTERVAL) as timer:
                 sleep(10)
 
+    with Timeline() as timeline:
+        with timeline_span("step", "outer"):
+            run("true", quiet=True)
+
+            proc = start("sleep 0.1", quiet=True)
+            wait(proc)
+
+        run("false", check=False)
+
+    assert [str(x.name) for x in timeline.spans] == ["outer", "'false'"], timeline.spans
+
+    outer = timeline.spans[0]
+    assert [x.kind for x in outer.children] == ["run", "start"], outer.children
+    assert outer.children[0].children == [], outer.children[0].children
+    assert outer.children[1].duration >= 0.1, outer.children[1]
+    assert outer.duration >= outer.children[1].duration, outer
+    assert timeline.spans[1].kind == "run", timeline.spans[1]
+
+    with expect_output(contains="step outer") as out:
+        with output_redirected(out, quiet=True):
+            print_timeline(timeline)
+
+    with working_dir():
+        write_timeline_json(timeline, "timeline.json")
+        data = read_json("timeline.json")
+
+        assert data["spans"][0]["name"] == "outer", data
+        assert data["spans"][0]["children"][1]["kind"] == "start", data
+
+        write_timeline_trace(timeline, "trace.json")
+        data = read_json("trace.json")
+
+        assert [x["name"] for x in data["traceEvents"] if x["ph"] == "X"][0] == "outer", data
+
+    with timeline_span("step", "ignored") as span:
+        assert span is None, span
+
 @test
 def unique_id_operations():
     id1 = get_unique_id()
@@ -1245,6 +1488,21 @@ def plano_command():
         run_command()
         run_command("--help")
 
+        # The second help request uses the command index
+        with expect_output(contains="command index") as out:
+            with output_redirected(out, quiet=True):
+                run_command("--profile-startup", "--help")
+
+        with expect_system_exit():
+            run_command("echo", "--help")
+
+        # Command help comes from the command even when the index
+        # exists.  A passthrough command handles --help itself.
+        for i in range(2):
+            remove("dancer.json")
+            run_command("dancer", "gamma", "--help")
+            assert read_json("dancer.json") == ["--help"], i
+
         with expect_system_exit():
             run_command("no-such-command")
 
@@ -1333,6 +1591,20 @@ def plano_command():
         result = read_json("invisible.json")
         assert result == "nothing"
 
+        with expect_output(contains="command echoecho") as out:
+            with output_redirected(out, quiet=True):
+                run_command("--timing", "splasher,echoecho", "Greetings")
+
+            result = read(out)
+            assert "command splasher" in result, result
+            assert "  command echo" in result, result
+
+        with expect_output(contains="cumulative") as out:
+            with output_redirected(out, quiet=True):
+                run_command("--profile", "--profile-output", "profile/echo.prof", "echo", "Hello")
+
+        assert is_file("profile/echo.prof")
+
 
 
 def main():
@@ -21,9 +21,11 @@ from .main import *
 
 import argparse as _argparse
 import importlib as _importlib
+import importlib.util as _importlib_util
 import inspect as _inspect
 import os as _os
 import sys as _sys
+import time as _time
 import traceback as _traceback
 
 class BaseCommand:
@@ -88,6 +90,14 @@ class PlanoCommand(BaseCommand):
         self.pre_parser = BaseArgumentParser(description=description, add_help=False)
         self.pre_parser.add_argument("-h", "--help", action="store_true",
                                      help="Show this help message and exit")
+        self.pre_parser.add_argument("--profile-startup", action="store_true",
+                                     help="Print the time spent importing Plano and loading commands")
+        self.pre_parser.add_argument("--timing", action="store_true",
+                                     help="Print a timeline of the commands, processes, and HTTP requests run")
+        self.pre_parser.add_argument("--profile", action="store_true",
+                                     help="Run the command under cProfile and print the slowest functions")
+        self.pre_parser.add_argument("--profile-output", metavar="FILE",
+                                     help="With --profile, also write pstats data to FILE (for snakeviz, flameprof, etc.)")
 
         if self.module is None:
             self.pre_parser.add_argument("-f", "--file", help="Load commands from FILE (default '.plano.py')")
@@ -106,17 +116,48 @@ class PlanoCommand(BaseCommand):
         _plano_command = self
 
     def parse_args(self, args):
+        start_time = _time.perf_counter()
+
         pre_args, _ = self.pre_parser.parse_known_args(args)
 
+        # Printing the top-level help needs only the command names and
+        # parameters, so it can use the cached command index.  A named
+        # command may print its own help, so it needs the module.
+        help_only = pre_args.command is None
+        load_source = None
+
         if self.module is None:
             if pre_args.module is None:
-                self.module = self._load_file(pre_args.file)
+                file = self._find_plano_file(pre_args.file)
+
+                if file is not None and help_only:
+                    index = _read_command_index(file)
+
+                    if index is not None:
+                        self.bound_commands = index
+                        load_source = "command index"
+
+                if file is not None and load_source is None:
+                    prev_modules = set(_sys.modules)
+
+                    self.module = self._load_file(file)
+                    self._bind_commands(self.module)
+
+                    load_source = f"file '{file}'"
+
+                    if _read_command_index(file) is None:
+                        modules = [_sys.modules[x] for x in set(_sys.modules) - prev_modules]
+                        _write_command_index(file, self.bound_commands, modules)
             else:
                 self.module = self._load_module(pre_args.module)
+                self._bind_commands(self.module)
 
-        if self.module is not None:
+                load_source = f"module '{pre_args.module}'"
+        else:
             self._bind_commands(self.module)
 
+        load_time = _time.perf_counter() - start_time
+
         self._process_commands()
 
         self.preceding_commands = list()
@@ -132,7 +173,12 @@ class PlanoCommand(BaseCommand):
 
             args[args.index(pre_args.command)] = names[-1]
 
-        args, self.passthrough_args = self.parser.parse_known_args(args)
+        try:
+            args, self.passthrough_args = self.parser.parse_known_args(args)
+        finally:
+            if pre_args.profile_startup:
+                parse_time = _time.perf_counter() - start_time - load_time
+                _print_startup_profile(load_time, parse_time, load_source)
 
         return args
 
@@ -148,15 +194,15 @@ class PlanoCommand(BaseCommand):
 
     def init(self, args):
         self.help = args.help
+        self.timing = args.timing
+        self.profile = args.profile or args.profile_output is not None
+        self.profile_output = args.profile_output
 
         self.selected_command = None
         self.command_args = list()
         self.command_kwargs = dict()
 
         if args.command is not None:
-            for command in self.preceding_commands:
-                command()
-
             self.selected_command = self.bound_commands[args.command]
 
             if not self.selected_command.passthrough and self.passthrough_args:
@@ -182,8 +228,33 @@ class PlanoCommand(BaseCommand):
             self.parser.print_help()
             return
 
-        with Timer() as timer:
-            self.selected_command(*self.command_args, **self.command_kwargs)
+        timeline = Timeline() if self.timing else None
+        profiler = None
+
+        if self.profile:
+            import cProfile as _cProfile
+            profiler = _cProfile.Profile()
+
+        if timeline is not None:
+            timeline.start()
+
+        if profiler is not None:
+            profiler.enable()
+
+        try:
+            with Timer() as timer:
+                for command in self.preceding_commands:
+                    command()
+
+                self.selected_command(*self.command_args, **self.command_kwargs)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                _print_profile(profiler, self.profile_output)
+
+            if timeline is not None:
+                timeline.stop()
+                print_timeline(timeline, file=_sys.stderr)
 
         if not self.quiet:
             cprint("OK", color="green", file=_sys.stderr, end="")
@@ -195,7 +266,7 @@ class PlanoCommand(BaseCommand):
         except ImportError:
             exit("Module '{}' not found", name)
 
-    def _load_file(self, path):
+    def _find_plano_file(self, path):
         if path is not None and is_dir(path):
             path = self._find_file(path)
 
@@ -205,15 +276,15 @@ class PlanoCommand(BaseCommand):
         if path is None:
             path = self._find_file(get_current_dir())
 
-        if path is None:
-            return
+        return path
 
+    def _load_file(self, path):
         debug("Loading '{}'", path)
 
         _sys.path.insert(0, join(get_parent_dir(path), "python"))
 
-        spec = _importlib.util.spec_from_file_location("_plano", path)
-        module = _importlib.util.module_from_spec(spec)
+        spec = _importlib_util.spec_from_file_location("_plano", path)
+        module = _importlib_util.module_from_spec(spec)
         _sys.modules["_plano"] = module
 
         try:
@@ -297,6 +368,156 @@ class PlanoCommand(BaseCommand):
 
             _capitalize_help(subparser)
 
+def _print_startup_profile(load_time, parse_time, load_source):
+    from . import _import_time
+
+    props = (
+        ("Import time", "{:.1f} ms".format(_import_time * 1000)),
+        ("Load time", "{:.1f} ms".format(load_time * 1000), "(from {})".format(nvl(load_source, "[none]"))),
+        ("Parse time", "{:.1f} ms".format(parse_time * 1000)),
+    )
+
+    print_properties(props, file=_sys.stderr)
+
+def _print_profile(profiler, output_file):
+    import pstats as _pstats
+
+    cprint("=== Profile ===", color="cyan", file=_sys.stderr)
+
+    stats = _pstats.Stats(profiler, stream=_sys.stderr)
+    stats.sort_stats("cumulative").print_stats(25)
+
+    if output_file is not None:
+        make_parent_dir(output_file, quiet=True)
+        profiler.dump_stats(output_file)
+
+        eprint("Profile data written to '{}'".format(output_file))
+
+# The command index caches the names, help text, and parameters of
+# the commands in a .plano.py file.  It is valid as long as the file
+# and the modules it imported are unchanged.
+
+_command_index_version = 1
+
+def _get_command_index_file(file):
+    import hashlib as _hashlib
+
+    digest = _hashlib.sha256(get_absolute_path(file).encode("utf-8")).hexdigest()
+
+    return join(get_user_temp_dir(), "plano", "command-index", f"{digest[:32]}.json")
+
+def _get_file_digest(file):
+    import hashlib as _hashlib
+
+    with open(file, "rb") as f:
+        return _hashlib.sha256(f.read()).hexdigest()
+
+def _get_mtime(file):
+    try:
+        return _os.stat(file).st_mtime_ns
+    except OSError:
+        return None
+
+def _is_indexable(value):
+    if isinstance(value, list):
+        return all(_is_indexable(x) for x in value)
+
+    return value is None or isinstance(value, (str, int, float, bool))
+
+def _read_command_index(file):
+    index_file = _get_command_index_file(file)
+
+    try:
+        data = read_json(index_file)
+    except (OSError, ValueError):
+        return
+
+    try:
+        if data["version"] != _command_index_version or data["digest"] != _get_file_digest(file):
+            return
+
+        for dependency, mtime in data["dependencies"].items():
+            if _get_mtime(dependency) != mtime:
+                return
+
+        commands = dict()
+
+        for cdata in data["commands"]:
+            parameters = dict()
+
+            for pdata in cdata["parameters"]:
+                type = _indexable_types.get(pdata["type"])
+                param = CommandParameter(pdata["name"], display_name=pdata["display_name"], type=type,
+                                         metavar=pdata["metavar"], help=pdata["help"],
+                                         short_option=pdata["short_option"], default=pdata["default"],
+                                         positional=pdata["positional"])
+                param.optional = pdata["optional"]
+                param.multiple = pdata["multiple"]
+
+                parameters[param.name] = param
+
+            commands[cdata["name"]] = Namespace(name=cdata["name"], help=cdata["help"],
+                                                description=cdata["description"], hidden=cdata["hidden"],
+                                                passthrough=cdata["passthrough"], parameters=parameters)
+    except (KeyError, TypeError):
+        return
+
+    debug("Using the command index for '{}'", file)
+
+    return commands
+
+_indexable_types = {x.__name__: x for x in (str, int, float, bool, list)}
+
+def _write_command_index(file, commands, modules):
+    dependencies = [__file__, join(get_parent_dir(__file__), "main.py")]
+    dependencies += [x.__file__ for x in modules if getattr(x, "__file__", None) is not None]
+
+    cdatas = list()
+
+    for command in commands.values():
+        pdatas = list()
+
+        for param in command.parameters.values():
+            if param.type is not None and param.type not in _indexable_types.values():
+                return
+
+            if not _is_indexable(param.default):
+                return
+
+            pdatas.append({
+                "name": param.name,
+                "display_name": param.display_name,
+                "type": None if param.type is None else param.type.__name__,
+                "metavar": param.metavar,
+                "help": param.help,
+                "short_option": param.short_option,
+                "default": param.default,
+                "positional": param.positional,
+                "optional": param.optional,
+                "multiple": param.multiple,
+            })
+
+        cdatas.append({
+            "name": command.name,
+            "help": command.help,
+            "description": command.description,
+            "hidden": command.hidden,
+            "passthrough": command.passthrough,
+            "parameters": pdatas,
+        })
+
+    data = {
+        "version": _command_index_version,
+        "digest": _get_file_digest(file),
+        "dependencies": {x: _get_mtime(x) for x in unique(dependencies)},
+        "commands": cdatas,
+    }
+
+    try:
+        write_json(_get_command_index_file(file), data)
+    except OSError as e:
+        debug("Failed writing the command index: {}", e)
+
 _command_help = {
     "build":    "Build artifacts from source",
     "clean":    "Clean up the source tree",
@@ -432,7 +653,8 @@ def command(_function=None, name=None, parameters=None, parent=None, passthrough
 
                     eprint()
 
-            self.function(*args, **kwargs)
+            with timeline_span("command", self.name):
+                self.function(*args, **kwargs)
 
             if not app.quiet:
                 cprint("{}<-- {}".format(dashes, self.name), color="magenta", file=_sys.stderr)
@@ -17,30 +17,25 @@
 # under the License.
 #
 
-import base64 as _base64
-import binascii as _binascii
-import code as _code
-import datetime as _datetime
+import atexit as _atexit
+import collections as _collections
+import errno as _errno
 import fnmatch as _fnmatch
-import getpass as _getpass
+import io as _io
 import json as _json
 import os as _os
-import pprint as _pprint
-import pkgutil as _pkgutil
-import random as _random
 import re as _re
 import shlex as _shlex
 import shutil as _shutil
 import signal as _signal
-import socket as _socket
+import stat as _stat
 import subprocess as _subprocess
 import sys as _sys
-import tempfile as _tempfile
+import threading as _threading
 import time as _time
-import traceback as _traceback
-import urllib as _urllib
-import urllib.parse as _urllib_parse
-import uuid as _uuid
+
+# Modules that are slow to import or needed only by a few functions
+# are imported where they are used, to keep startup fast
 
 _max = max
 
@@ -73,69 +68,142 @@ PLANO_COLOR = "PLANO_COLOR" in ENV
 
 ## Archive operations
 
-def make_archive(input_dir, output_file=None, quiet=False):
-    check_program("tar")
+# Archives are gzipped tar files.  They are written in chunks that are
+# compressed in parallel, each as a separate gzip member.  Standard
+# gzip readers treat the members as one stream.
+#
+# jobs=None - Use the number of CPUs for compression
+def make_archive(input_dir, output_file=None, jobs=None, quiet=False):
+    import tarfile as _tarfile
 
     archive_stem = get_base_name(input_dir)
 
     if output_file is None:
-        # tar on Windows needs this
-        base = join(get_current_dir(), archive_stem)
-        base = base.replace("\\", "/")
+        output_file = join(get_current_dir(), f"{archive_stem}.tar.gz")
 
-        output_file = f"{base}.tar.gz"
+    _notice(quiet, "Making archive {!r} from directory {!r}", output_file, input_dir)
 
-    _notice(quiet, "Making archive {} from directory {}", repr(output_file), repr(input_dir))
+    make_parent_dir(output_file, quiet=True)
 
-    with working_dir(get_parent_dir(input_dir), quiet=True):
-        run(f"tar -czf {output_file} {archive_stem}", quiet=True)
+    with _parallel_gzip_writer(output_file, jobs) as out:
+        with _tarfile.open(fileobj=out, mode="w|") as tar:
+            tar.add(input_dir, arcname=archive_stem)
 
     return output_file
 
 def extract_archive(input_file, output_dir=None, quiet=False):
-    check_program("tar")
+    import tarfile as _tarfile
 
     if output_dir is None:
         output_dir = get_current_dir()
 
-    _notice(quiet, "Extracting archive {} to directory {}", repr(input_file), repr(output_dir))
-
-    input_file = get_absolute_path(input_file)
+    _notice(quiet, "Extracting archive {!r} to directory {!r}", input_file, output_dir)
 
-    # tar on Windows needs this
-    input_file = input_file.replace("\\", "/")
+    make_dir(output_dir, quiet=True)
 
-    with working_dir(output_dir, quiet=True):
-        run(f"tar -xf {input_file}", quiet=True)
+    with _tarfile.open(input_file, "r:*") as tar:
+        if hasattr(_tarfile, "tar_filter"):
+            tar.extractall(output_dir, filter="tar")
+        else: # pragma: nocover
+            tar.extractall(output_dir)
 
     return output_dir
 
-def rename_archive(input_file, new_archive_stem, quiet=False):
-    _notice(quiet, "Renaming archive {} with stem {}", repr(input_file), repr(new_archive_stem))
+# Copies the members to a new archive, replacing the top-level
+# directory name as it goes
+def rename_archive(input_file, new_archive_stem, jobs=None, quiet=False):
+    import tarfile as _tarfile
 
-    output_dir = get_absolute_path(get_parent_dir(input_file))
-    output_file = "{}.tar.gz".format(join(output_dir, new_archive_stem))
-
-    # tar on Windows needs this
-    output_file = output_file.replace("\\", "/")
+    _notice(quiet, "Renaming archive {!r} with stem {!r}", input_file, new_archive_stem)
 
     input_file = get_absolute_path(input_file)
+    output_file = "{}.tar.gz".format(join(get_parent_dir(input_file), new_archive_stem))
+
+    def rename(path):
+        parts = remove_prefix(path, "./").split("/", 1)
+        parts[0] = new_archive_stem
+
+        return "/".join(parts)
+
+    with temp_file(dir=get_parent_dir(output_file)) as temp:
+        with _tarfile.open(input_file, "r:*") as tar_in:
+            with _parallel_gzip_writer(temp, jobs) as out:
+                with _tarfile.open(fileobj=out, mode="w|", format=tar_in.format) as tar_out:
+                    for member in tar_in:
+                        content = tar_in.extractfile(member) if member.isreg() else None
 
-    with working_dir(quiet=True):
-        extract_archive(input_file, quiet=True)
+                        member.name = rename(member.name)
+                        member.pax_headers.pop("path", None)
 
-        input_name = list_dir()[0]
-        input_dir = move(input_name, new_archive_stem, quiet=True)
+                        if member.islnk():
+                            member.linkname = rename(member.linkname)
+                            member.pax_headers.pop("linkpath", None)
 
-        make_archive(input_dir, output_file=output_file, quiet=True)
+                        tar_out.addfile(member, content)
 
-    remove(input_file, quiet=True)
+        _os.replace(temp, output_file)
+
+    if output_file != input_file:
+        remove(input_file, quiet=True)
 
     return output_file
 
+class _parallel_gzip_writer:
+    def __init__(self, file, jobs=None, chunk_size=1 << 20, level=6):
+        import concurrent.futures as _futures
+
+        self.file = open(file, "wb")
+        self.jobs = nvl(jobs, _os.cpu_count() or 1)
+        self.chunk_size = chunk_size
+        self.level = level
+
+        self.executor = _futures.ThreadPoolExecutor(max_workers=max(1, self.jobs))
+        self.pending = _collections.deque()
+        self.buffer = bytearray()
+        self.chunks = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                if self.buffer or self.chunks == 0:
+                    self._submit(bytes(self.buffer))
+
+                while self.pending:
+                    self.file.write(self.pending.popleft().result())
+        finally:
+            self.executor.shutdown()
+            self.file.close()
+
+    def write(self, data):
+        self.buffer += data
+
+        while len(self.buffer) >= self.chunk_size:
+            chunk = bytes(self.buffer[:self.chunk_size])
+            del self.buffer[:self.chunk_size]
+
+            self._submit(chunk)
+
+        return len(data)
+
+    def _submit(self, chunk):
+        import gzip as _gzip
+
+        # zlib releases the GIL while compressing
+        self.pending.append(self.executor.submit(_gzip.compress, chunk, self.level, mtime=0))
+        self.chunks += 1
+
+        # Bound the memory held by compressed chunks waiting to be
+        # written in order
+        while len(self.pending) > self.jobs * 2:
+            self.file.write(self.pending.popleft().result())
+
 ## Console operations
 
 def flush():
+    _flush_logging()
     _sys.stdout.flush()
     _sys.stderr.flush()
 
@@ -213,7 +281,7 @@ class output_redirected:
     def __enter__(self):
         flush()
 
-        _notice(self.quiet, "Redirecting output to file {}", repr(self.output))
+        _notice(self.quiet, "Redirecting output to file {!r}", self.output)
 
         if is_string(self.output):
             output = open(self.output, "w")
@@ -234,6 +302,8 @@ except NameError: # pragma: nocover
         pdb.set_trace()
 
 def repl(locals): # pragma: nocover
+    import code as _code
+
     _code.InteractiveConsole(locals=locals).interact()
 
 def print_properties(props, file=None):
@@ -302,7 +372,7 @@ def make_parent_dir(path, quiet=False):
 
 # Returns the current working directory so you can change it back
 def change_dir(dir, quiet=False):
-    _debug(quiet, "Changing directory to {}", repr(dir))
+    _debug(quiet, "Changing directory to {!r}", dir)
 
     prev_dir = get_current_dir()
 
@@ -372,7 +442,7 @@ class working_dir:
         if self.dir == ".":
             return
 
-        _notice(self.quiet, "Entering directory {}", repr(get_absolute_path(self.dir)))
+        _notice(self.quiet, "Entering directory {!r}", _lazy(get_absolute_path, self.dir))
 
         make_dir(self.dir, quiet=True)
 
@@ -384,7 +454,7 @@ class working_dir:
         if self.dir == ".":
             return
 
-        _debug(self.quiet, "Returning to directory {}", repr(get_absolute_path(self.prev_dir)))
+        _debug(self.quiet, "Returning to directory {!r}", _lazy(get_absolute_path, self.prev_dir))
 
         change_dir(self.prev_dir, quiet=True)
 
@@ -403,9 +473,13 @@ def get_home_dir(user=None):
     return _os.path.expanduser("~{}".format(user or ""))
 
 def get_user():
+    import getpass as _getpass
+
     return _getpass.getuser()
 
 def get_hostname():
+    import socket as _socket
+
     return _socket.gethostname()
 
 def get_program_name(command=None):
@@ -429,6 +503,8 @@ def check_env(var, message=None):
         raise PlanoError(message)
 
 def check_module(module, message=None):
+    import pkgutil as _pkgutil
+
     if _pkgutil.find_loader(module) is None:
         if message is None:
             message = "Python module {} is not found".format(repr(module))
@@ -506,6 +582,8 @@ def print_env(file=None):
     print_properties(props, file=file)
 
 def print_stack(file=None):
+    import traceback as _traceback
+
     _traceback.print_stack(file=file)
 
 ## File operations
@@ -513,7 +591,7 @@ def print_stack(file=None):
 def touch(file, quiet=False):
     file = expand(file)
 
-    _notice(quiet, "Touching {}", repr(file))
+    _notice(quiet, "Touching {!r}", file)
 
     try:
         _os.utime(file, None)
@@ -524,11 +602,12 @@ def touch(file, quiet=False):
 
 # symlinks=True - Preserve symlinks
 # inside=True - Place from_path inside to_path if to_path is a directory
-def copy(from_path, to_path, symlinks=True, inside=True, quiet=False):
+# jobs=1 - Copy the files of a directory tree using jobs threads
+def copy(from_path, to_path, symlinks=True, inside=True, jobs=1, quiet=False):
     from_path = expand(from_path)
     to_path = expand(to_path)
 
-    _notice(quiet, "Copying {} to {}", repr(from_path), repr(to_path))
+    _notice(quiet, "Copying {!r} to {!r}", from_path, to_path)
 
     if is_dir(to_path) and inside:
         to_path = join(to_path, get_base_name(from_path))
@@ -538,21 +617,71 @@ def copy(from_path, to_path, symlinks=True, inside=True, quiet=False):
     if is_link(from_path) and symlinks:
         make_link(to_path, read_link(from_path), quiet=True)
     elif is_dir(from_path):
-        for name in list_dir(from_path):
-            copy(join(from_path, name), join(to_path, name), symlinks=symlinks, inside=False, quiet=True)
-
-        _shutil.copystat(from_path, to_path)
+        _copy_tree(from_path, to_path, symlinks, jobs)
     else:
-        _shutil.copy2(from_path, to_path)
+        _copy_file(from_path, to_path)
 
     return to_path
 
+def _copy_tree(from_dir, to_dir, symlinks, jobs):
+    dirs = list()
+    files = list()
+
+    for root, dir_names, file_names in _os.walk(from_dir, followlinks=not symlinks):
+        to_root = join(to_dir, get_relative_path(root, from_dir))
+
+        make_dir(to_root, quiet=True)
+        dirs.append((root, to_root))
+
+        for name in dir_names + file_names:
+            path = join(root, name)
+
+            if symlinks and is_link(path):
+                make_link(join(to_root, name), read_link(path), quiet=True)
+            elif name in file_names:
+                files.append((path, join(to_root, name)))
+
+    if jobs > 1 and len(files) > 1:
+        import concurrent.futures as _futures
+
+        with _futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            for _ in executor.map(lambda x: _copy_file(*x), files):
+                pass
+    else:
+        for from_file, to_file in files:
+            _copy_file(from_file, to_file)
+
+    # Children first, so copying files doesn't disturb the parent mtimes
+    for from_root, to_root in reversed(dirs):
+        _shutil.copystat(from_root, to_root)
+
+# Use copy_file_range where available.  It lets the kernel copy the
+# data without a trip through user space, and some filesystems share
+# the blocks instead of copying them.
+def _copy_file(from_file, to_file):
+    if hasattr(_os, "copy_file_range") and not (exists(to_file) and _os.path.samefile(from_file, to_file)):
+        try:
+            with open(from_file, "rb") as fin:
+                if _stat.S_ISREG(_os.fstat(fin.fileno()).st_mode):
+                    with open(to_file, "wb") as fout:
+                        while _os.copy_file_range(fin.fileno(), fout.fileno(), 1 << 30) > 0:
+                            pass
+
+                    _shutil.copystat(from_file, to_file)
+
+                    return
+        except OSError as e:
+            if e.errno not in (_errno.EXDEV, _errno.ENOSYS, _errno.EINVAL, _errno.EOPNOTSUPP, _errno.EBADF):
+                raise
+
+    _shutil.copy2(from_file, to_file)
+
 # inside=True - Place from_path inside to_path if to_path is a directory
 def move(from_path, to_path, inside=True, quiet=False):
     from_path = expand(from_path)
     to_path = expand(to_path)
 
-    _notice(quiet, "Moving {} to {}", repr(from_path), repr(to_path))
+    _notice(quiet, "Moving {!r} to {!r}", from_path, to_path)
 
     to_path = copy(from_path, to_path, inside=inside, quiet=True)
     remove(from_path, quiet=True)
@@ -563,7 +692,7 @@ def replace(path, replacement, quiet=False):
     path = expand(path)
     replacement = expand(replacement)
 
-    _notice(quiet, "Replacing {} with {}", repr(path), repr(replacement))
+    _notice(quiet, "Replacing {!r} with {!r}", path, replacement)
 
     with temp_dir() as backup_dir:
         backup = join(backup_dir, "backup")
@@ -599,7 +728,7 @@ def remove(paths, quiet=False):
         if not exists(path):
             continue
 
-        _debug(quiet, "Removing {}", repr(path))
+        _debug(quiet, "Removing {!r}", path)
 
         if is_dir(path):
             _shutil.rmtree(path, ignore_errors=True)
@@ -641,9 +770,9 @@ def append(file, string):
 def prepend(file, string):
     file = expand(file)
 
-    orig = read(file)
+    _prepend(file, lambda f: f.write(string))
 
-    return write(file, string + orig)
+    return file
 
 def tail(file, count):
     file = expand(file)
@@ -678,20 +807,60 @@ def append_lines(file, lines):
 def prepend_lines(file, lines):
     file = expand(file)
 
-    orig_lines = read_lines(file)
+    _prepend(file, lambda f: f.writelines(lines))
 
-    make_parent_dir(file, quiet=True)
+    return file
 
-    with open(file, "w") as f:
-        f.writelines(lines)
-        f.writelines(orig_lines)
+# Write the new content and then the old content to a temp file beside
+# the original, and rename it into place
+def _prepend(file, write_func):
+    import tempfile as _tempfile
 
-    return file
+    file = get_real_path(file)
+    fd, temp = _tempfile.mkstemp(prefix=".plano-", dir=get_parent_dir(file))
+
+    try:
+        with open(fd, "w") as out:
+            write_func(out)
+            out.flush()
+
+            with open(file, "rb") as f:
+                _shutil.copyfileobj(f, out.buffer)
+
+        _shutil.copymode(file, temp)
+        _os.replace(temp, file)
+    except:
+        remove(temp, quiet=True)
+        raise
 
+# Read blocks backward from the end of the file until we have enough
+# lines
 def tail_lines(file, count):
     assert count >= 0, count
 
-    lines = read_lines(file)
+    file = expand(file)
+
+    if count == 0:
+        return []
+
+    block_size = 65536
+
+    with open(file, "rb") as f:
+        offset = f.seek(0, _os.SEEK_END)
+        data = b""
+
+        while offset > 0 and data.count(b"\n", 0, len(data) - 1) < count:
+            size = min(block_size, offset)
+            offset -= size
+
+            f.seek(offset)
+            data = f.read(size) + data
+
+    if offset > 0:
+        # Drop the partial first line
+        data = data[data.index(b"\n") + 1:]
+
+    lines = _io.TextIOWrapper(_io.BytesIO(data)).readlines()
 
     return lines[-count:]
 
@@ -766,8 +935,12 @@ def _run_curl(method, url, content=None, content_file=None, content_type=None, o
               user=None, password=None, quiet=False):
     check_program("curl")
 
-    _notice(quiet, f"Sending {method} request to '{url}'")
+    _notice(quiet, "Sending {} request to '{}'", method, url)
+
+    with timeline_span("http", "{} {}".format(method, url)):
+        return _send_curl_request(method, url, content, content_file, content_type, output_file, insecure, user, password)
 
+def _send_curl_request(method, url, content, content_file, content_type, output_file, insecure, user, password):
     args = ["curl", "-sfL"]
 
     if method != "GET":
@@ -843,7 +1016,7 @@ def http_post_json(url, data, insecure=False, user=None, password=None, quiet=Fa
 ## Link operations
 
 def make_link(path: str, linked_path: str, quiet=False) -> str:
-    _notice(quiet, "Making symlink {} to {}", repr(path), repr(linked_path))
+    _notice(quiet, "Making symlink {!r} to {!r}", path, linked_path)
 
     make_parent_dir(path, quiet=True)
     remove(path, quiet=True)
@@ -873,12 +1046,34 @@ _DISABLED = _logging_levels.index("disabled")
 
 _logging_output = None
 _logging_threshold = _NOTICE
-_logging_contexts = list()
-
-def enable_logging(level="notice", output=None, quiet=False):
+_logging_local = _threading.local()
+_logging_format = "text"
+_logging_buffered = False
+
+# Held while the buffer is changed or written out, since threads
+# log at the same time.  Reentrant because _write_log flushes.
+_logging_buffer_lock = _threading.RLock()
+_logging_buffer = list()
+_logging_buffer_output = None
+_logging_buffer_size = 0
+_logging_flush_time = 0
+
+# Buffered output is written when it passes this many characters or
+# this many seconds since the last write
+_logging_buffer_limit = 64 * 1024
+_logging_flush_interval = 1
+
+# level="notice" - Messages below this level are discarded
+# output=None - A file or file path; stderr if none
+# format="text" - "text" for console messages or "json" for one JSON record per line
+# buffered=False - If true, collect messages and write them in batches
+def enable_logging(level="notice", output=None, format="text", buffered=False, quiet=False):
     assert level in _logging_levels, level
+    assert format in ("text", "json"), format
+
+    _notice(quiet, "Enabling logging (level={!r}, output={!r}, format={!r})", level, nvl(output, "stderr"), format)
 
-    _notice(quiet, "Enabling logging (level={}, output={})", repr(level), repr(nvl(output, "stderr")))
+    _flush_logging()
 
     global _logging_threshold
     _logging_threshold = _logging_levels.index(level)
@@ -889,45 +1084,66 @@ def enable_logging(level="notice", output=None, quiet=False):
     global _logging_output
     _logging_output = output
 
+    global _logging_format
+    _logging_format = format
+
+    global _logging_buffered
+    _logging_buffered = buffered
+
 def disable_logging(quiet=False):
     _notice(quiet, "Disabling logging")
 
+    _flush_logging()
+
     global _logging_threshold
     _logging_threshold = _DISABLED
 
 class logging_enabled:
-    def __init__(self, level="notice", output=None):
+    def __init__(self, level="notice", output=None, format="text", buffered=False):
         self.level = level
         self.output = output
+        self.format = format
+        self.buffered = buffered
 
     def __enter__(self):
         self.prev_level = _logging_levels[_logging_threshold]
         self.prev_output = _logging_output
+        self.prev_format = _logging_format
+        self.prev_buffered = _logging_buffered
 
         if self.level == "disabled":
             disable_logging(quiet=True)
         else:
-            enable_logging(level=self.level, output=self.output, quiet=True)
+            enable_logging(level=self.level, output=self.output, format=self.format, buffered=self.buffered, quiet=True)
 
     def __exit__(self, exc_type, exc_value, traceback):
         if self.prev_level == "disabled":
             disable_logging(quiet=True)
         else:
-            enable_logging(level=self.prev_level, output=self.prev_output, quiet=True)
+            enable_logging(level=self.prev_level, output=self.prev_output, format=self.prev_format,
+                           buffered=self.prev_buffered, quiet=True)
 
 class logging_disabled(logging_enabled):
     def __init__(self):
         super().__init__(level="disabled")
 
+# Each thread has its own stack of logging contexts
+def _get_logging_contexts():
+    try:
+        return _logging_local.contexts
+    except AttributeError:
+        _logging_local.contexts = list()
+        return _logging_local.contexts
+
 class logging_context:
     def __init__(self, name):
         self.name = name
 
     def __enter__(self):
-        _logging_contexts.append(self.name)
+        _get_logging_contexts().append(self.name)
 
     def __exit__(self, exc_type, exc_value, traceback):
-        _logging_contexts.pop()
+        _get_logging_contexts().pop()
 
 def fail(message, *args):
     if isinstance(message, BaseException):
@@ -961,42 +1177,130 @@ def log(level, message, *args):
         _print_message(level, message, args)
 
 def _print_message(level, message, args):
-    line = list()
     out = nvl(_logging_output, _sys.stderr)
+    exception = None
 
-    program_text = "{}:".format(get_program_name())
+    if isinstance(message, BaseException):
+        exception = message
+        message = str(exception)
+    else:
+        message = str(message)
 
-    line.append(cformat(program_text, color="gray"))
+        if args:
+            message = message.format(*args)
 
-    level_text = "{}:".format(_logging_levels[level])
-    level_color = ("white", "cyan", "yellow", "red", None)[level]
-    level_bright = (False, False, False, True, False)[level]
+        message = capitalize(message)
 
-    line.append(cformat(level_text, color=level_color, bright=level_bright))
+    if _logging_format == "json":
+        record = _format_json_message(level, message, exception)
+    else:
+        record = _format_text_message(level, message, exception, _is_color_enabled(out))
 
-    for name in _logging_contexts:
-        line.append(cformat("{}:".format(name), color="yellow"))
+    _write_log(out, record, level >= _ERROR)
 
-    if isinstance(message, BaseException):
-        exception = message
+def _format_text_message(level, message, exception, color):
+    line = list()
 
-        line.append(str(exception))
+    def add(text, color_name, bright=False):
+        if color and color_name is not None:
+            line.append("".join((_get_color_code(color_name, bright), text, _color_reset)))
+        else:
+            line.append(text)
 
-        print(" ".join(line), file=out)
+    add("{}:".format(get_program_name()), "gray")
+    add("{}:".format(_logging_levels[level]), ("white", "cyan", "yellow", "red", None)[level], level == _ERROR)
 
-        if hasattr(exception, "__traceback__"):
-            _traceback.print_exception(type(exception), exception, exception.__traceback__, file=out)
-    else:
-        message = str(message)
+    for name in _get_logging_contexts():
+        add("{}:".format(name), "yellow")
 
-        if args:
-            message = message.format(*args)
+    line.append(message)
+
+    text = " ".join(line) + "\n"
+
+    if exception is not None and getattr(exception, "__traceback__", None) is not None:
+        import traceback as _traceback
+
+        text += "".join(_traceback.format_exception(type(exception), exception, exception.__traceback__))
+
+    return text
+
+def _format_json_message(level, message, exception):
+    record = {
+        "time": _time.time(),
+        "level": _logging_levels[level],
+        "program": get_program_name(),
+        "contexts": list(_get_logging_contexts()),
+        "message": message,
+    }
+
+    if exception is not None and getattr(exception, "__traceback__", None) is not None:
+        import traceback as _traceback
 
-        line.append(capitalize(message))
+        record["traceback"] = "".join(_traceback.format_exception(type(exception), exception, exception.__traceback__))
 
-        print(" ".join(line), file=out)
+    return _json.dumps(record) + "\n"
 
-    out.flush()
+def _write_log(out, text, urgent=False):
+    global _logging_buffer_output, _logging_buffer_size
+
+    if not _logging_buffered:
+        out.write(text)
+        out.flush()
+        return
+
+    with _logging_buffer_lock:
+        if out is not _logging_buffer_output:
+            _flush_logging()
+            _logging_buffer_output = out
+
+        _logging_buffer.append(text)
+        _logging_buffer_size += len(text)
+
+        if urgent or _logging_buffer_size >= _logging_buffer_limit \
+           or _time.monotonic() - _logging_flush_time >= _logging_flush_interval:
+            _flush_logging()
+
+# Write any buffered log messages
+def _flush_logging():
+    global _logging_buffer_output, _logging_buffer_size, _logging_flush_time
+
+    # The write stays under the lock so that buffers from different
+    # threads come out in order
+    with _logging_buffer_lock:
+        _logging_flush_time = _time.monotonic()
+
+        if not _logging_buffer:
+            return
+
+        out = _logging_buffer_output
+
+        text = "".join(_logging_buffer)
+
+        _logging_buffer.clear()
+        _logging_buffer_output = None
+        _logging_buffer_size = 0
+
+        try:
+            out.write(text)
+            out.flush()
+        except ValueError:
+            # The output was closed before the buffer was written
+            pass
+
+_atexit.register(_flush_logging)
+
+# Defers a call until a log message is formatted, so that work
+# for suppressed messages is skipped
+class _lazy:
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+
+    def __str__(self):
+        return str(self.function(*self.args))
+
+    def __repr__(self):
+        return repr(self.function(*self.args))
 
 def _notice(quiet, message, *args):
     if quiet:
@@ -1139,7 +1443,7 @@ def check_dir(path):
 def await_exists(path, timeout=30, quiet=False):
     path = expand(path)
 
-    _notice(quiet, "Waiting for path {} to exist", repr(path))
+    _notice(quiet, "Waiting for path {!r} to exist", path)
 
     timeout_message = "Timed out waiting for path {} to exist".format(path)
     period = 0.03125
@@ -1157,6 +1461,8 @@ def await_exists(path, timeout=30, quiet=False):
 ## Port operations
 
 def get_random_port(min=49152, max=65535):
+    import random as _random
+
     ports = [_random.randint(min, max) for _ in range(3)]
 
     for port in ports:
@@ -1168,6 +1474,8 @@ def get_random_port(min=49152, max=65535):
     raise PlanoError("Random ports unavailable")
 
 def check_port(port, host="localhost"):
+    import socket as _socket
+
     sock = _socket.socket(_socket.AF_INET, _socket.SOCK_STREAM)
     sock.setsockopt(_socket.SOL_SOCKET, _socket.SO_REUSEADDR, 1)
 
@@ -1180,18 +1488,22 @@ def await_port(port, host="localhost", timeout=30, quiet=False):
     if is_string(port):
         port = int(port)
 
-    timeout_message = "Timed out waiting for port {} to open".format(port)
+    # This uses a deadline instead of a Timer timeout, since the
+    # alarm signal works only in the main thread
+    deadline = get_time() + timeout
     period = 0.03125
 
-    with Timer(timeout=timeout, timeout_message=timeout_message) as timer:
-        while True:
-            try:
-                check_port(port, host=host)
-            except PlanoError:
-                sleep(period, quiet=True)
-                period = min(1, period * 2)
-            else:
-                return
+    while True:
+        try:
+            check_port(port, host=host)
+        except PlanoError:
+            if get_time() >= deadline:
+                raise PlanoTimeout("Timed out waiting for port {} to open".format(port))
+
+            sleep(min(period, max(0, deadline - get_time())), quiet=True)
+            period = min(1, period * 2)
+        else:
+            return
 
 ## Process operations
 
@@ -1219,8 +1531,13 @@ def _format_command(command, represent=True):
 # stdout=<file> - Send stdout to a file
 # stderr=<file> - Send stderr to a file
 # shell=False - XXX
-def start(command, stdin=None, stdout=None, stderr=None, output=None, shell=False, stash=False, quiet=False):
-    _notice(quiet, "Starting a new process (command {})", _format_command(command))
+# env=<dict> - Run the process with this environment instead of the current one
+def start(command, stdin=None, stdout=None, stderr=None, output=None, shell=False, stash=False, env=None,
+          quiet=False):
+    _notice(quiet, "Starting a new process (command {})", _lazy(_format_command, command))
+
+    # Keep log messages ahead of the child's output
+    _flush_logging()
 
     if output is not None:
         stdout, stderr = output, output
@@ -1268,10 +1585,15 @@ def start(command, stdin=None, stdout=None, stderr=None, output=None, shell=Fals
         args = [expand(str(x)) for x in args]
 
     try:
-        proc = PlanoProcess(args, stdin=stdin, stdout=stdout, stderr=stderr, shell=shell, close_fds=True, stash_file=stash_file)
+        proc = PlanoProcess(args, stdin=stdin, stdout=stdout, stderr=stderr, shell=shell, close_fds=True, env=env,
+                            stash_file=stash_file)
     except OSError as e:
         raise PlanoError("Command {}: {}".format(_format_command(command), str(e)))
 
+    if _active_timeline is not None:
+        # The span stays open until the process is waited for
+        proc.timeline_span = _active_timeline._open_span("start", _lazy(_format_command, command), push=False)
+
     _notice(quiet, "{} started", proc)
 
     return proc
@@ -1317,6 +1639,9 @@ def wait(proc, timeout=None, check=False, quiet=False):
         else:
             debug("{} exited with code {}", proc, proc.exit_code)
 
+    if proc.timeline_span is not None and proc.timeline_span.duration is None:
+        proc.timeline_span.close(failed=proc.exit_code != 0)
+
     if proc.stash_file is not None:
         if proc.exit_code > 0:
             eprint(read(proc.stash_file), end="")
@@ -1330,18 +1655,39 @@ def wait(proc, timeout=None, check=False, quiet=False):
     return proc
 
 # input=<string> - Pipe <string> to the process
+# line_handler=<function> - Call <function> with each line of stdout as it arrives
+# tail_lines=<count> - With line_handler, keep the last <count> lines for error reporting
+# env=<dict> - Run the process with this environment instead of the current one
 def run(command, stdin=None, stdout=None, stderr=None, input=None, output=None,
-        stash=False, shell=False, check=True, quiet=False):
-    _notice(quiet, "Running command {}", _format_command(command))
+        stash=False, shell=False, check=True, line_handler=None, tail_lines=100, env=None, quiet=False):
+    _notice(quiet, "Running command {}", _lazy(_format_command, command))
+
+    with timeline_span("run", _lazy(_format_command, command)):
+        return _run(command, stdin, stdout, stderr, input, output, stash, shell, check, line_handler, tail_lines, env)
 
+def _run(command, stdin, stdout, stderr, input, output, stash, shell, check, line_handler, tail_lines, env):
     if input is not None:
         assert stdin in (None, _subprocess.PIPE), stdin
 
         input = input.encode("utf-8")
         stdin = _subprocess.PIPE
 
+    if line_handler is not None:
+        assert stdout is None and output is None and not stash
+
+        proc = _start_streaming(command, stdin, stderr, input, shell, tail_lines, env)
+
+        try:
+            for line in _read_streaming_lines(proc):
+                line_handler(line)
+        except:
+            stop(proc, quiet=True)
+            raise
+
+        return wait(proc, check=check, quiet=True)
+
     proc = start(command, stdin=stdin, stdout=stdout, stderr=stderr, output=output,
-                 stash=stash, shell=shell, quiet=True)
+                 stash=stash, shell=shell, env=env, quiet=True)
 
     proc.stdout_result, proc.stderr_result = proc.communicate(input=input)
 
@@ -1353,15 +1699,102 @@ def run(command, stdin=None, stdout=None, stderr=None, input=None, output=None,
 
     return wait(proc, check=check, quiet=True)
 
+# Yields the lines of stdout as they arrive.  Stderr goes to stdout
+# unless it is redirected.  Only the last tail_lines lines are kept in
+# memory, for error reporting.
+def stream_lines(command, stdin=None, stderr=None, input=None, shell=False, check=True, tail_lines=100,
+                 env=None, quiet=False):
+    _notice(quiet, "Streaming output from command {}", _lazy(_format_command, command))
+
+    if input is not None:
+        assert stdin in (None, _subprocess.PIPE), stdin
+
+        input = input.encode("utf-8")
+        stdin = _subprocess.PIPE
+
+    proc = _start_streaming(command, stdin, stderr, input, shell, tail_lines, env)
+
+    try:
+        yield from _read_streaming_lines(proc)
+    except BaseException:
+        stop(proc, quiet=True)
+        raise
+
+    wait(proc, check=check, quiet=True)
+
+def _start_streaming(command, stdin, stderr, input, shell, tail_lines, env):
+    proc = start(command, stdin=stdin, stdout=_subprocess.PIPE, stderr=nvl(stderr, _subprocess.STDOUT),
+                 shell=shell, env=env, quiet=True)
+
+    proc.output_tail = _collections.deque(maxlen=tail_lines)
+
+    if input is not None:
+        def write_input():
+            try:
+                proc.stdin.write(input)
+                proc.stdin.close()
+            except OSError: # pragma: nocover
+                pass
+
+        _threading.Thread(target=write_input, daemon=True).start()
+
+    return proc
+
+def _read_streaming_lines(proc):
+    with proc.stdout:
+        for line in proc.stdout:
+            line = line.decode("utf-8", errors="replace")
+            proc.output_tail.append(line)
+
+            yield line
+
 # input=<string> - Pipe the given input into the process
-def call(command, input=None, shell=False, quiet=False):
-    _notice(quiet, "Calling {}", _format_command(command))
+def call(command, input=None, shell=False, env=None, quiet=False):
+    _notice(quiet, "Calling {}", _lazy(_format_command, command))
 
     proc = run(command, stdin=_subprocess.PIPE, stdout=_subprocess.PIPE, stderr=_subprocess.PIPE,
-               input=input, shell=shell, check=True, quiet=True)
+               input=input, shell=shell, check=True, env=env, quiet=True)
 
     return proc.stdout_result
 
+# Runs the commands concurrently, at most jobs at a time, and returns
+# the finished processes in command order.  Their output is captured
+# in stdout_result and stderr_result.
+#
+# jobs=None - Use the number of CPUs
+# check=True - Raise an error for the first failed command after all have finished
+def run_many(commands, jobs=None, shell=False, check=True, quiet=False):
+    import concurrent.futures as _futures
+
+    commands = list(commands)
+    jobs = nvl(jobs, _os.cpu_count() or 1)
+
+    _notice(quiet, "Running {} {} (jobs={})", len(commands), plural("command", len(commands)), jobs)
+
+    def run_one(command):
+        _debug(quiet, "Running command {}", _lazy(_format_command, command))
+
+        with Timer() as timer:
+            proc = run(command, stdin=DEVNULL, stdout=_subprocess.PIPE, stderr=_subprocess.PIPE,
+                       shell=shell, check=False, quiet=True)
+
+        proc.elapsed_time = timer.elapsed_time
+
+        _debug(quiet, "{} exited with code {} ({})", proc, proc.exit_code, format_duration(proc.elapsed_time))
+
+        return proc
+
+    with _futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        procs = list(executor.map(run_one, commands))
+
+    if check:
+        for proc in procs:
+            if proc.exit_code > 0:
+                error("{} exited with code {}", proc, proc.exit_code)
+                raise PlanoProcessError(proc)
+
+    return procs
+
 def exit(arg=None, *args, **kwargs):
     verbose = kwargs.get("verbose", False)
 
@@ -1402,6 +1835,8 @@ class PlanoProcess(_subprocess.Popen):
         self.args = args
         self.stdout_result = None
         self.stderr_result = None
+        self.output_tail = None
+        self.timeline_span = None
 
         _child_processes.append(self)
 
@@ -1420,7 +1855,13 @@ class PlanoProcess(_subprocess.Popen):
 
 class PlanoProcessError(_subprocess.CalledProcessError, PlanoError):
     def __init__(self, proc):
-        super().__init__(proc.exit_code, _format_command(proc.args, represent=False))
+        output = None
+
+        if proc.output_tail is not None:
+            output = "".join(proc.output_tail)
+
+        super().__init__(proc.exit_code, _format_command(proc.args, represent=False), output=output,
+                         stderr=proc.stderr_result)
 
 def _default_sigterm_handler(signum, frame):
     for proc in _child_processes:
@@ -1492,23 +1933,35 @@ def capitalize(string):
     return string[0].upper() + string[1:]
 
 def base64_encode(string):
+    import base64 as _base64
+
     return _base64.b64encode(string)
 
 def base64_decode(string):
+    import base64 as _base64
+
     return _base64.b64decode(string)
 
 def url_encode(string):
+    import urllib.parse as _urllib_parse
+
     return _urllib_parse.quote_plus(string)
 
 def url_decode(string):
+    import urllib.parse as _urllib_parse
+
     return _urllib_parse.unquote_plus(string)
 
 def parse_url(url):
+    import urllib.parse as _urllib_parse
+
     return _urllib_parse.urlparse(url)
 
 ## Temp operations
 
 def get_system_temp_dir():
+    import tempfile as _tempfile
+
     return _tempfile.gettempdir()
 
 def get_user_temp_dir():
@@ -1518,12 +1971,16 @@ def get_user_temp_dir():
         return join(get_system_temp_dir(), get_user())
 
 def make_temp_file(prefix="plano-", suffix="", dir=None):
+    import tempfile as _tempfile
+
     if dir is None:
         dir = get_system_temp_dir()
 
     return _tempfile.mkstemp(prefix=prefix, suffix=suffix, dir=dir)[1]
 
 def make_temp_dir(prefix="plano-", suffix="", dir=None):
+    import tempfile as _tempfile
+
     if dir is None:
         dir = get_system_temp_dir()
 
@@ -1531,6 +1988,8 @@ def make_temp_dir(prefix="plano-", suffix="", dir=None):
 
 class temp_file:
     def __init__(self, prefix="plano-", suffix="", dir=None):
+        import tempfile as _tempfile
+
         if dir is None:
             dir = get_system_temp_dir()
 
@@ -1563,9 +2022,13 @@ def get_time():
 
 # Python UTC time
 def get_datetime():
+    import datetime as _datetime
+
     return _datetime.datetime.now(tz=_datetime.timezone.utc)
 
 def parse_timestamp(timestamp, format="%Y-%m-%dT%H:%M:%SZ"):
+    import datetime as _datetime
+
     if timestamp is None:
         return None
 
@@ -1679,10 +2142,207 @@ class Timer:
     def raise_timeout(self, *args):
         raise PlanoTimeout(self.timeout_message)
 
+_active_timeline = None
+
+# A hierarchical record of where time goes.  While a timeline is
+# started, plano commands and calls to run(), start(), and the HTTP
+# functions add spans to it.
+class Timeline:
+    def __init__(self):
+        self.spans = list()
+        self.start_time = None
+        self.stop_time = None
+        self.start_wall_time = None
+
+        self._lock = _threading.Lock()
+        self._local = _threading.local()
+        self._main_stack = None
+        self._prev_timeline = None
+
+    def start(self):
+        global _active_timeline
+
+        self.start_time = _time.perf_counter()
+        self.start_wall_time = _time.time()
+        self._main_stack = self._get_stack()
+        self._prev_timeline = _active_timeline
+
+        _active_timeline = self
+
+    def stop(self):
+        global _active_timeline
+
+        self.stop_time = _time.perf_counter()
+
+        _active_timeline = self._prev_timeline
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _get_stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = list()
+            return self._local.stack
+
+    def _open_span(self, kind, name, push=True):
+        stack = self._get_stack()
+
+        # Spans from worker threads attach to the innermost span of
+        # the thread that started the timeline
+        if stack:
+            parent = stack[-1]
+        elif self._main_stack:
+            parent = self._main_stack[-1]
+        else:
+            parent = None
+
+        # Run and HTTP spans are leaves.  Their internal calls to
+        # start() and run() are not recorded separately.
+        if parent is not None and parent.kind in ("run", "http"):
+            return None
+
+        span = TimelineSpan(kind, name, self.start_time)
+
+        with self._lock:
+            if parent is None:
+                self.spans.append(span)
+            else:
+                parent.children.append(span)
+
+        if push:
+            stack.append(span)
+
+        return span
+
+    def _close_span(self, span, failed=False):
+        span.close(failed)
+        self._get_stack().pop()
+
+class TimelineSpan:
+    def __init__(self, kind, name, origin):
+        self.kind = kind
+        self.name = name
+        self.start_time = _time.perf_counter() - origin
+        self.duration = None
+        self.failed = False
+        self.children = list()
+        self.thread_name = _threading.current_thread().name
+
+        self._origin = origin
+
+    def close(self, failed=False):
+        self.duration = _time.perf_counter() - self._origin - self.start_time
+        self.failed = failed
+
+    def __repr__(self):
+        return "{} {} ({})".format(self.kind, self.name, self.duration)
+
+# Records the enclosed code as a span of the active timeline, if any
+class timeline_span:
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.timeline = _active_timeline
+        self.span = None
+
+    def __enter__(self):
+        if self.timeline is not None:
+            self.span = self.timeline._open_span(self.kind, self.name)
+
+        return self.span
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.span is not None:
+            self.timeline._close_span(self.span, failed=exc_type is not None)
+
+def print_timeline(timeline, file=None):
+    def print_spans(spans, depth):
+        for span in spans:
+            duration = "-" if span.duration is None else "{:.3f}s".format(span.duration)
+            label = "{}{} {}".format("  " * depth, span.kind, span.name)
+
+            if len(label) > 100:
+                label = label[:97] + "..."
+
+            if span.failed:
+                label += " [failed]"
+
+            print("{:>9.3f}s {:>9}  {}".format(span.start_time, duration, label), file=file)
+
+            print_spans(span.children, depth + 1)
+
+    cprint("=== Timeline ===", color="cyan", file=file)
+
+    print("{:>10} {:>9}  {}".format("Start", "Duration", "Operation"), file=file)
+
+    print_spans(timeline.spans, 0)
+
+# Times are in seconds from the start of the timeline
+def write_timeline_json(timeline, file):
+    def convert(span):
+        return {
+            "kind": span.kind,
+            "name": str(span.name),
+            "start_time": span.start_time,
+            "end_time": None if span.duration is None else span.start_time + span.duration,
+            "duration": span.duration,
+            "failed": span.failed,
+            "thread": span.thread_name,
+            "children": [convert(x) for x in span.children],
+        }
+
+    data = {
+        "start_time": timeline.start_wall_time,
+        "spans": [convert(x) for x in timeline.spans],
+    }
+
+    return write_json(file, data)
+
+# Writes the Chrome trace event format, for chrome://tracing or
+# https://ui.perfetto.dev
+def write_timeline_trace(timeline, file):
+    events = list()
+    thread_ids = dict()
+
+    def convert(span):
+        thread_id = thread_ids.setdefault(span.thread_name, len(thread_ids) + 1)
+
+        if span.duration is not None:
+            events.append({
+                "name": str(span.name),
+                "cat": span.kind,
+                "ph": "X",
+                "ts": round(span.start_time * 1000000),
+                "dur": round(span.duration * 1000000),
+                "pid": 1,
+                "tid": thread_id,
+                "args": {"failed": span.failed},
+            })
+
+        for child in span.children:
+            convert(child)
+
+    for span in timeline.spans:
+        convert(span)
+
+    for name, thread_id in thread_ids.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": thread_id, "args": {"name": name}})
+
+    return write_json(file, {"traceEvents": events, "displayTimeUnit": "ms"})
+
 ## Unique ID operations
 
 # Length in bytes, renders twice as long in hex
 def get_unique_id(bytes=16):
+    import binascii as _binascii
+    import uuid as _uuid
+
     assert bytes >= 1
     assert bytes <= 16
 
@@ -1709,6 +2369,8 @@ def is_empty(value):
     return value in (None, "", (), [], {})
 
 def pformat(value):
+    import pprint as _pprint
+
     return _pprint.pformat(value, width=120)
 
 def format_empty(value, replacement):
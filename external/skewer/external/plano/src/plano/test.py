@@ -21,7 +21,6 @@ from .main import *
 from .command import *
 
 import argparse as _argparse
-import asyncio as _asyncio
 import fnmatch as _fnmatch
 import functools as _functools
 import importlib as _importlib
@@ -55,6 +54,8 @@ class PlanoTestCommand(BaseCommand):
                                  help="Exit on the first failure encountered in a test run")
         self.parser.add_argument("--iterations", metavar="COUNT", type=int, default=1,
                                  help="Run the tests COUNT times (default 1)")
+        self.parser.add_argument("--changed-only", action="store_true",
+                                 help="Skip tests whose inputs are unchanged since they last passed")
         self.parser.add_argument("--verbose", action="store_true",
                                  help="Print detailed logging to the console")
         self.parser.add_argument("--quiet", action="store_true",
@@ -81,6 +82,7 @@ class PlanoTestCommand(BaseCommand):
         self.timeout = args.timeout
         self.fail_fast = args.fail_fast
         self.iterations = args.iterations
+        self.changed_only = args.changed_only
         self.verbose = args.verbose
         self.quiet = args.quiet
 
@@ -100,12 +102,13 @@ class PlanoTestCommand(BaseCommand):
                       exclude=self.exclude_patterns,
                       enable=self.enable_patterns, unskip=self.unskip_patterns,
                       test_timeout=self.timeout, fail_fast=self.fail_fast,
-                      verbose=self.verbose, quiet=self.quiet)
+                      changed_only=self.changed_only, verbose=self.verbose, quiet=self.quiet)
 
 class PlanoTestSkipped(Exception):
     pass
 
-def test(_function=None, name=None, module=None, timeout=None, disabled=False):
+# inputs=<paths> - Files the test depends on, for --changed-only
+def test(_function=None, name=None, module=None, timeout=None, disabled=False, inputs=()):
     class Test:
         def __init__(self, function):
             self.function = function
@@ -113,6 +116,10 @@ def test(_function=None, name=None, module=None, timeout=None, disabled=False):
             self.module = module
             self.timeout = timeout
             self.disabled = disabled
+            self.inputs = inputs
+
+            if is_string(self.inputs):
+                self.inputs = (self.inputs,)
 
             if self.name is None:
                 self.name = self.function.__name__.strip("_").replace("_", "-")
@@ -130,6 +137,8 @@ def test(_function=None, name=None, module=None, timeout=None, disabled=False):
                 ret = self.function()
 
                 if _inspect.iscoroutine(ret):
+                    import asyncio as _asyncio
+
                     _asyncio.run(ret)
             except SystemExit as e:
                 error(e)
@@ -218,7 +227,7 @@ def print_tests(modules):
             print(" ".join((str(test), flags)).strip())
 
 def run_tests(modules, include="*", exclude=(), enable=(), unskip=(), test_timeout=300,
-              fail_fast=False, verbose=False, quiet=False):
+              fail_fast=False, changed_only=False, cache_file=None, verbose=False, quiet=False):
     if _inspect.ismodule(modules):
         modules = (modules,)
 
@@ -236,6 +245,9 @@ def run_tests(modules, include="*", exclude=(), enable=(), unskip=(), test_timeo
 
     test_run = TestRun(test_timeout=test_timeout, fail_fast=fail_fast, verbose=verbose, quiet=quiet)
 
+    if changed_only:
+        test_run.cache = _TestCache(cache_file)
+
     if verbose:
         notice("Starting {}", test_run)
     elif not quiet:
@@ -245,6 +257,7 @@ def run_tests(modules, include="*", exclude=(), enable=(), unskip=(), test_timeo
             ("Modules", format_empty(", ".join([x.__name__ for x in modules]), "[none]")),
             ("Test timeout", format_duration(test_timeout)),
             ("Fail fast", fail_fast),
+            ("Changed only", changed_only),
         )
 
         print_properties(props)
@@ -283,17 +296,26 @@ def run_tests(modules, include="*", exclude=(), enable=(), unskip=(), test_timeo
         if not verbose and not quiet:
             print()
 
+    if test_run.cache is not None:
+        test_run.cache.save()
+
     total = len(test_run.tests)
     skipped = len(test_run.skipped_tests)
+    unchanged = len(test_run.unchanged_tests)
     failed = len(test_run.failed_tests)
 
     if total == 0:
         raise PlanoError("No tests ran")
 
-    notes = ""
+    notes = list()
 
     if skipped != 0:
-        notes = "({} skipped)".format(skipped)
+        notes.append("{} skipped".format(skipped))
+
+    if unchanged != 0:
+        notes.append("{} unchanged".format(unchanged))
+
+    notes = format_not_empty(", ".join(notes), "({})")
 
     if failed == 0:
         result_message = "All tests passed {}".format(notes).strip()
@@ -308,11 +330,14 @@ def run_tests(modules, include="*", exclude=(), enable=(), unskip=(), test_timeo
     elif not quiet:
         cprint("=== Summary ===", color="cyan")
 
-        props = (
+        props = [
             ("Total", total),
             ("Skipped", skipped, format_not_empty(", ".join([x.name for x in test_run.skipped_tests]), "({})")),
             ("Failed", failed, format_not_empty(", ".join([x.name for x in test_run.failed_tests]), "({})")),
-        )
+        ]
+
+        if changed_only:
+            props.insert(2, ("Unchanged", unchanged))
 
         print_properties(props)
         print()
@@ -335,6 +360,21 @@ def _run_test(test_run, test, unskipped):
     elif not test_run.quiet:
         print("{:.<65} ".format(test.name + " "), end="")
 
+    digest = None
+
+    if test_run.cache is not None:
+        digest = _get_test_digest(test)
+
+        if test_run.cache.is_unchanged(test, digest):
+            test_run.unchanged_tests.append(test)
+
+            if test_run.verbose:
+                notice("{} UNCHANGED", test)
+            elif not test_run.quiet:
+                cprint("UNCHANGED", color="gray")
+
+            return
+
     timeout = nvl(test.timeout, test_run.test_timeout)
 
     with temp_file() as output_file:
@@ -358,6 +398,9 @@ def _run_test(test_run, test, unskipped):
         except Exception as e:
             test_run.failed_tests.append(test)
 
+            if test_run.cache is not None:
+                test_run.cache.discard(test)
+
             if test_run.verbose:
                 _traceback.print_exc()
 
@@ -379,6 +422,9 @@ def _run_test(test_run, test, unskipped):
         else:
             test_run.passed_tests.append(test)
 
+            if test_run.cache is not None:
+                test_run.cache.record(test, digest)
+
             if test_run.verbose:
                 notice("{} PASSED ({})", test, format_duration(timer.elapsed_time))
             elif not test_run.quiet:
@@ -415,14 +461,98 @@ class TestRun:
         self.fail_fast = fail_fast
         self.verbose = verbose
         self.quiet = quiet
+        self.cache = None
 
         self.tests = list()
         self.skipped_tests = list()
+        self.unchanged_tests = list()
         self.failed_tests = list()
         self.passed_tests = list()
 
     def __repr__(self):
         return format_repr(self)
 
+# The cache maps each test to the digest of its inputs at the time it
+# last passed.  The whole cache is dropped when Plano itself changes.
+class _TestCache:
+    def __init__(self, file=None):
+        self.file = nvl(file, join(get_user_temp_dir(), "plano", "test-cache.json"))
+        self.plano_digest = _get_plano_digest()
+        self.entries = dict()
+
+        if is_file(self.file):
+            try:
+                data = read_json(self.file)
+            except ValueError:
+                data = dict()
+
+            if data.get("plano") == self.plano_digest:
+                self.entries = data.get("tests", dict())
+
+    def is_unchanged(self, test, digest):
+        return self.entries.get(_get_test_key(test)) == digest
+
+    def record(self, test, digest):
+        self.entries[_get_test_key(test)] = digest
+
+    def discard(self, test):
+        self.entries.pop(_get_test_key(test), None)
+
+    def save(self):
+        write_json(self.file, {"plano": self.plano_digest, "tests": self.entries})
+
+def _get_test_key(test):
+    return "{}:{}".format(test.module.__name__, test.name)
+
+def _get_test_digest(test):
+    import hashlib as _hashlib
+
+    hash = _hashlib.sha256()
+    function = test.function
+
+    if isinstance(function, _functools.partial):
+        hash.update(repr((function.args, sorted(function.keywords.items()))).encode("utf-8"))
+        function = function.func
+
+    try:
+        hash.update(_inspect.getsource(function).encode("utf-8"))
+    except (OSError, TypeError):
+        hash.update(function.__code__.co_code)
+
+    module_file = getattr(test.module, "__file__", None)
+
+    for file in [module_file] + list(test.inputs):
+        hash.update(nvl(file, "").encode("utf-8"))
+        _update_file_digest(hash, file)
+
+    return hash.hexdigest()
+
+def _update_file_digest(hash, file):
+    if file is None or not is_file(file):
+        hash.update(b"\0")
+        return
+
+    with open(expand(file), "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            hash.update(chunk)
+
+_plano_digest = None
+
+def _get_plano_digest():
+    global _plano_digest
+
+    if _plano_digest is None:
+        import hashlib as _hashlib
+
+        hash = _hashlib.sha256()
+        plano_dir = get_parent_dir(__file__)
+
+        for name in list_dir(plano_dir, "*.py"):
+            _update_file_digest(hash, join(plano_dir, name))
+
+        _plano_digest = hash.hexdigest()
+
+    return _plano_digest
+
 def _main(): # pragma: nocover
     PlanoTestCommand().main()
@@ -17,8 +17,18 @@
 # under the License.
 #
 
+import codecs
+import concurrent.futures
+import hashlib
 import inspect
-
+import json
+import os
+import select
+import signal
+import subprocess
+import threading
+
+from copy import deepcopy
 from plano import *
 
 __all__ = [
@@ -28,122 +38,287 @@ __all__ = [
 standard_text = read_yaml(join(get_parent_dir(__file__), "standardtext.yaml"))
 standard_steps = read_yaml(join(get_parent_dir(__file__), "standardsteps.yaml"))
 
+# Resolved model data, keyed on the input digest
+_model_cache = dict()
+
+# GitHub owner and repo names, keyed on the working directory
+_github_owner_repo_cache = dict()
+
 def check_environment():
     check_program("base64")
     check_program("curl")
     check_program("kubectl")
     check_program("skupper")
 
-def resource_exists(resource):
-    return run(f"kubectl get {resource}", output=DEVNULL, check=False, quiet=True).exit_code == 0
+# env=<dict> - Run kubectl with this environment instead of the current one
+def resource_exists(resource, env=None):
+    return run(f"kubectl get {resource}", output=DEVNULL, check=False, env=env, quiet=True).exit_code == 0
 
-def get_resource_json(resource, jsonpath=""):
-    return call(f"kubectl get {resource} -o jsonpath='{{{jsonpath}}}'", quiet=True)
+def get_resource_json(resource, jsonpath="", env=None):
+    return call(f"kubectl get {resource} -o jsonpath='{{{jsonpath}}}'", env=env, quiet=True)
 
-def await_resource(resource, timeout=300):
+def await_resource(resource, timeout=300, env=None):
     assert "/" in resource, resource
 
-    start_time = get_time()
+    try:
+        await_resources([resource], timeout=timeout, env=env)
+    except PlanoError:
+        if resource.startswith("deployment/"):
+            run(f"kubectl logs {resource}", check=False, env=env)
 
-    while True:
-        notice(f"Waiting for {resource} to become available")
+        raise
 
-        if resource_exists(resource):
-            break
+# Waits for all the resources at once.  Deployments must also be
+# available.  Resources of the same kind share one kubectl watch.
+def await_resources(resources, timeout=300, namespace=None, env=None):
+    notice(f"Waiting for {', '.join(resources)} to become available")
 
-        if get_time() - start_time > timeout:
-            fail(f"Timed out waiting for {resource}")
+    conditions = dict()
 
-        sleep(5, quiet=True)
+    for resource in resources:
+        assert "/" in resource, resource
+        conditions[resource] = is_resource_ready
 
-    if resource.startswith("deployment/"):
-        try:
-            run(f"kubectl wait --for condition=available --timeout {timeout}s {resource}", quiet=True, stash=True)
-        except:
-            run(f"kubectl logs {resource}")
-            raise
+    with timeline_span("await", ", ".join(resources)):
+        return await_resource_conditions(conditions, timeout=timeout, namespace=namespace, env=env)
 
-def await_ingress(service, timeout=300):
-    assert service.startswith("service/"), service
+def is_resource_ready(data):
+    if data.get("kind") == "Deployment":
+        for condition in data.get("status", dict()).get("conditions", []):
+            if condition.get("type") == "Available":
+                return condition.get("status") == "True"
 
-    start_time = get_time()
+        return False
+
+    return True
+
+def has_ingress(data):
+    return bool(data.get("status", dict()).get("loadBalancer", dict()).get("ingress"))
+
+# Waits until each resource satisfies its condition, a function that
+# takes the resource JSON.  Returns the resource JSON by resource.
+#
+# Changes come from 'kubectl get <kind> --watch' streams, one per
+# resource kind in the namespace.  If a watch is not available or
+# ends, its resources are polled with exponential backoff instead.
+def await_resource_conditions(conditions, timeout=300, namespace=None, env=None):
+    deadline = get_time() + timeout
+    pending = dict(conditions)
+    results = dict()
+
+    def update(resource, data):
+        if data is not None and resource in pending and pending[resource](data):
+            results[resource] = data
+            del pending[resource]
+
+    kinds = sorted(set(x.split("/", 1)[0] for x in pending))
+    watches = [ResourceWatch(x, namespace=namespace, env=env) for x in kinds]
+    delays = backoff_delays()
+    next_poll_time = get_time()
 
-    await_resource(service, timeout=timeout)
+    try:
+        while pending:
+            now = get_time()
+
+            if now > deadline:
+                fail(f"Timed out waiting for {', '.join(pending)}")
+
+            live_watches = [x for x in watches if not x.closed]
+            live_kinds = [x.kind for x in live_watches]
+            unwatched = [x for x in pending if x.split("/", 1)[0] not in live_kinds]
+
+            if unwatched and now >= next_poll_time:
+                for resource in unwatched:
+                    update(resource, get_resource_data(resource, namespace=namespace, env=env))
+
+                next_poll_time = get_time() + next(delays)
+                continue
+
+            wake_time = deadline
+
+            if unwatched:
+                wake_time = min(wake_time, next_poll_time)
+
+            if live_watches:
+                ready, _, _ = select.select(live_watches, [], [], max(0, wake_time - now))
+
+                for watch in ready:
+                    for data in watch.read():
+                        update(f"{watch.kind}/{data['metadata']['name']}", data)
+            else:
+                sleep(max(0, wake_time - now), quiet=True)
+    finally:
+        for watch in watches:
+            watch.close()
+
+    return results
+
+# Yields sub-second delays that double up to five seconds
+def backoff_delays(start=0.25, limit=5):
+    delay = start
 
     while True:
-        notice(f"Waiting for hostname or IP from {service} to become available")
+        yield delay
+        delay = min(delay * 2, limit)
+
+def get_resource_data(resource, namespace=None, env=None):
+    args = ["kubectl", "get", resource, "-o", "json"]
+
+    if namespace is not None:
+        args.extend(["--namespace", namespace])
+
+    proc = run(args, stdout=subprocess.PIPE, stderr=DEVNULL, check=False, env=env, quiet=True)
+
+    if proc.exit_code == 0:
+        return parse_json(proc.stdout_result)
 
-        json = get_resource_json(service, ".status.loadBalancer.ingress")
+# A 'kubectl get <kind> --watch -o json' process.  It prints the
+# current resources of the kind and then each resource as it changes,
+# as a stream of JSON objects.
+class ResourceWatch:
+    def __init__(self, kind, namespace=None, env=None):
+        args = ["kubectl", "get", kind, "--watch", "-o", "json"]
 
-        if json != "":
-            break
+        if namespace is not None:
+            args.extend(["--namespace", namespace])
 
-        if get_time() - start_time > timeout:
-            fail(f"Timed out waiting for hostnmae or external IP for {service}")
+        self.kind = kind
+        self.proc = start(args, stdout=subprocess.PIPE, stderr=DEVNULL, env=env, quiet=True)
+        self.closed = False
 
-        sleep(5, quiet=True)
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._json_decoder = json.JSONDecoder()
+        self._buffer = ""
 
-    data = parse_json(json)
+    def __repr__(self):
+        return f"watch for {self.kind}"
+
+    def fileno(self):
+        return self.proc.stdout.fileno()
+
+    # Returns the resource JSON objects completed by the available
+    # output.  Call it when the watch is readable.
+    def read(self):
+        data = os.read(self.fileno(), 65536)
+
+        if not data:
+            self.close()
+            return []
+
+        self._buffer += self._decoder.decode(data)
+
+        items = list()
+
+        while True:
+            text = self._buffer.lstrip()
+
+            try:
+                item, end = self._json_decoder.raw_decode(text)
+            except ValueError:
+                self._buffer = text
+                break
+
+            self._buffer = text[end:]
+
+            if item.get("kind") == "List":
+                items.extend(item.get("items", []))
+            elif "object" in item and "type" in item:
+                if item["type"] != "DELETED":
+                    items.append(item["object"])
+            else:
+                items.append(item)
+
+        return [x for x in items if "metadata" in x]
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+
+            stop(self.proc, quiet=True)
+            self.proc.stdout.close()
+
+def await_ingress(service, timeout=300, env=None):
+    assert service.startswith("service/"), service
 
-    if len(data):
-        if "hostname" in data[0]:
-            return data[0]["hostname"]
+    notice(f"Waiting for hostname or IP from {service} to become available")
 
-        if "ip" in data[0]:
-            return data[0]["ip"]
+    with timeline_span("await", f"ingress {service}"):
+        data = await_resource_conditions({service: has_ingress}, timeout=timeout, env=env)[service]
+    ingress = data["status"]["loadBalancer"]["ingress"]
+
+    if "hostname" in ingress[0]:
+        return ingress[0]["hostname"]
+
+    if "ip" in ingress[0]:
+        return ingress[0]["ip"]
 
     fail(f"Failed to get hostname or IP from {service}")
 
-def await_http_ok(service, url_template, user=None, password=None, timeout=300):
+def await_http_ok(service, url_template, user=None, password=None, timeout=300, env=None):
     assert service.startswith("service/"), service
 
     start_time = get_time()
 
-    ip = await_ingress(service, timeout=timeout)
+    ip = await_ingress(service, timeout=timeout, env=env)
+
+    timeout = timeout - (get_time() - start_time)
 
-    url = url_template.format(ip)
+    await_http_ok_url(url_template.format(ip), user=user, password=password, timeout=timeout)
+
+def await_http_ok_url(url, user=None, password=None, timeout=300):
+    start_time = get_time()
     insecure = url.startswith("https")
+    delays = backoff_delays()
 
-    while True:
-        notice(f"Waiting for HTTP OK from {url}")
+    notice(f"Waiting for HTTP OK from {url}")
 
-        try:
-            http_get(url, insecure=insecure, user=user, password=password, quiet=True)
-        except PlanoError:
-            if get_time() - start_time > timeout:
-                fail(f"Timed out waiting for HTTP OK from {url}")
+    with timeline_span("await", f"HTTP OK from {url}"):
+        while True:
+            try:
+                http_get(url, insecure=insecure, user=user, password=password, quiet=True)
+            except PlanoError:
+                if get_time() - start_time > timeout:
+                    fail(f"Timed out waiting for HTTP OK from {url}")
 
-            sleep(5, quiet=True)
-        else:
-            break
+                sleep(next(delays), quiet=True)
+            else:
+                break
 
-def await_console_ok():
-    await_resource("secret/skupper-console-users")
+def await_console_ok(env=None):
+    await_resource("secret/skupper-console-users", env=env)
 
-    password = get_resource_json("secret/skupper-console-users", ".data.admin")
+    password = get_resource_json("secret/skupper-console-users", ".data.admin", env=env)
     password = base64_decode(password)
 
-    await_http_ok("service/skupper", "https://{}:8010/", user="admin", password=password)
+    await_http_ok("service/skupper", "https://{}:8010/", user="admin", password=password, env=env)
 
-def run_steps(skewer_file, kubeconfigs=[], work_dir=None, debug=False):
+# parallel=False - Run the commands for each site in a step concurrently
+# platform=None - Run every site on this platform instead of its own, such as "local"
+def run_steps(skewer_file, kubeconfigs=[], work_dir=None, debug=False, parallel=False, platform=None):
     notice(f"Running steps (skewer_file='{skewer_file}')")
 
-    check_environment()
-
-    model = Model(skewer_file, kubeconfigs)
+    model = Model(skewer_file, kubeconfigs, platform=platform)
     model.check()
 
+    if any(x.platform != "local" for _, x in model.sites):
+        check_environment()
+
     if work_dir is None:
         work_dir = join(get_user_temp_dir(), "skewer")
         remove(work_dir, quiet=True)
         make_dir(work_dir, quiet=True)
 
+    model.local = LocalPlatform(work_dir)
+
+    timeline = Timeline()
+    timeline.start()
+
     try:
         for step in model.steps:
             if step.name == "cleaning_up":
                 continue
 
-            run_step(model, step, work_dir)
+            run_step(model, step, work_dir, parallel=parallel)
 
         if "SKEWER_DEMO" in ENV:
             pause_for_demo(model)
@@ -153,52 +328,421 @@ def run_steps(skewer_file, kubeconfigs=[], work_dir=None, debug=False):
 
         raise
     finally:
-        for step in model.steps:
-            if step.name == "cleaning_up":
-                run_step(model, step, work_dir, check=False)
-                break
+        try:
+            for step in model.steps:
+                if step.name == "cleaning_up":
+                    run_step(model, step, work_dir, check=False, parallel=parallel)
+                    break
+        finally:
+            model.local.stop()
+            timeline.stop()
+
+            # Don't let a failure to report hide a failure in the steps
+            try:
+                report_timing(timeline, work_dir)
+            except Exception as e:
+                warning(f"Failed to report timing: {e}")
 
-def run_step(model, step, work_dir, check=True):
+def run_step(model, step, work_dir, check=True, parallel=False):
     if not step.commands:
         return
 
     notice(f"Running {step}")
 
-    for site_name, commands in step.commands:
-        with dict(model.sites)[site_name] as site:
-            if site.platform == "kubernetes":
-                run(f"kubectl config set-context --current --namespace {site.namespace}", stdout=DEVNULL, quiet=True)
+    sites = dict(model.sites)
+    site_commands = [(sites[site_name], commands) for site_name, commands in step.commands]
 
-            for command in commands:
-                if command.apply == "readme":
-                    continue
+    with timeline_span("step", step.title):
+        if parallel and len(site_commands) > 1:
+            run_site_commands_in_parallel(site_commands, work_dir, check)
+            return
+
+        for site, commands in site_commands:
+            with site, timeline_span("site", site.name):
+                run_site_commands(site, commands, work_dir, check)
+
+# Each site gets a worker thread.  The workers pass the site
+# environment to their processes instead of changing the global
+# environment, and they prefix each line of command output with the
+# site name.  All the sites finish before the step ends.
+def run_site_commands_in_parallel(site_commands, work_dir, check):
+    output_lock = threading.Lock()
+
+    def run_site(site, commands):
+        def print_line(line):
+            with output_lock:
+                print(f"{site.name}: {line}", end="", flush=True)
+
+        # Name the thread for the timing trace
+        threading.current_thread().name = f"site {site.name}"
+
+        with logging_context(site.name), timeline_span("site", site.name):
+            run_site_commands(site, commands, work_dir, check, env=site.get_process_env(), line_handler=print_line)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(site_commands)) as executor:
+        futures = [executor.submit(run_site, site, commands) for site, commands in site_commands]
+
+    # Raise the error from the first failed site, in site order
+    for future in futures:
+        future.result()
+
+def run_site_commands(site, commands, work_dir, check, env=None, line_handler=None):
+    if site.platform == "kubernetes":
+        run(f"kubectl config set-context --current --namespace {site.namespace}", stdout=DEVNULL, env=env, quiet=True)
+
+    if site.platform == "local":
+        run_local_site_commands(site, commands, work_dir, check, env=env, line_handler=line_handler)
+        return
+
+    for command in commands:
+        if command.apply == "readme":
+            continue
+
+        if command.await_resource:
+            if is_string(command.await_resource):
+                await_resource(command.await_resource, env=env)
+            else:
+                await_resources(command.await_resource, env=env)
+
+        if command.await_ingress:
+            await_ingress(command.await_ingress, env=env)
+
+        if command.await_http_ok:
+            await_http_ok(*command.await_http_ok, env=env)
+
+        if command.await_console_ok:
+            await_console_ok(env=env)
+
+        if command.await_port:
+            with timeline_span("await", f"port {command.await_port}"):
+                await_port(command.await_port, timeout=300)
+
+        if command.run:
+            proc = run(command.run.replace("~", work_dir), shell=True, check=False, env=env,
+                       line_handler=line_handler)
+
+            if command.expect_failure:
+                if proc.exit_code == 0:
+                    fail("A command expected to fail did not fail")
+
+                continue
+
+            if check and proc.exit_code > 0:
+                raise PlanoProcessError(proc)
+
+# On local sites, "@port:<name>@" in commands is replaced by a random
+# port reserved for the name.  Commands with 'background' run as
+# processes until the steps are done.  The await commands wait for
+# the port named by the resource, so 'deployment/frontend' and
+# 'service/frontend' both mean port "frontend".
+def run_local_site_commands(site, commands, work_dir, check, env=None, line_handler=None):
+    local = site.model.local
+
+    for command in commands:
+        if command.apply == "readme":
+            continue
+
+        if command.await_resource:
+            resources = command.await_resource
+
+            if is_string(resources):
+                resources = [resources]
+
+            for resource in resources:
+                local.await_resource(resource)
+
+        if command.await_ingress:
+            local.await_resource(command.await_ingress)
+
+        if command.await_http_ok:
+            service, url_template = command.await_http_ok[:2]
+
+            local.await_resource(service)
+            await_http_ok_url(local.resolve(url_template).format("localhost"))
+
+        if command.await_console_ok:
+            notice("Skipping the console check on local site")
+
+        if command.await_port:
+            with timeline_span("await", f"port {command.await_port}"):
+                await_port(local.resolve(str(command.await_port)), timeout=300)
+
+        if command.forward:
+            local.forward(*[local.resolve(str(x)) for x in command.forward])
+
+        if command.run:
+            text = local.resolve(command.run.replace("~", work_dir))
+
+            if command.background:
+                local.start(site, text, env=env)
+                continue
+
+            proc = run(text, shell=True, check=False, env=env, line_handler=line_handler)
+
+            if command.expect_failure:
+                if proc.exit_code == 0:
+                    fail("A command expected to fail did not fail")
+
+                continue
+
+            if check and proc.exit_code > 0:
+                raise PlanoProcessError(proc)
+
+# Runs the processes of local sites and the TCP forwarders that stand
+# in for the links between them
+class LocalPlatform:
+    def __init__(self, work_dir):
+        self.work_dir = work_dir
+        self.ports = dict()
+        self.processes = list()
+        self.forwarders = list()
+
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "local platform"
+
+    def get_port(self, name):
+        with self._lock:
+            if name not in self.ports:
+                self.ports[name] = get_random_port()
+
+            return self.ports[name]
+
+    def resolve(self, text):
+        return string_replace(text, r"@port:([\w.-]+)@", lambda m: str(self.get_port(m.group(1))))
+
+    def start(self, site, command, env=None):
+        with self._lock:
+            output_file = join(self.work_dir, f"{site.name}-process-{len(self.processes) + 1}.log")
+
+        notice(f"Starting local process '{command}' (output in '{output_file}')")
+
+        proc = start(command, shell=True, output=output_file, env=env, quiet=True)
+        proc.output_file = output_file
+
+        with self._lock:
+            self.processes.append(proc)
+
+        return proc
+
+    # Accepts connections on listen_port and forwards them to
+    # target_port, like a Skupper link to an exposed service
+    def forward(self, listen_port, target_port):
+        notice(f"Forwarding local port {listen_port} to port {target_port}")
+
+        forwarder = TcpForwarder(int(listen_port), int(target_port))
+        forwarder.start()
+
+        with self._lock:
+            self.forwarders.append(forwarder)
 
-                if command.await_resource:
-                    await_resource(command.await_resource)
+    def await_resource(self, resource, timeout=300):
+        name = resource.split("/", 1)[-1]
 
-                if command.await_ingress:
-                    await_ingress(command.await_ingress)
+        if name not in self.ports:
+            fail(f"No local port is reserved for {resource}")
 
-                if command.await_http_ok:
-                    await_http_ok(*command.await_http_ok)
+        notice(f"Waiting for {resource} to become available")
+
+        deadline = get_time() + timeout
+
+        with timeline_span("await", resource):
+            while True:
+                self.check_processes()
+
+                try:
+                    await_port(self.ports[name], timeout=min(1, max(0, deadline - get_time())), quiet=True)
+                except PlanoTimeout:
+                    if get_time() >= deadline:
+                        fail(f"Timed out waiting for {resource}")
+                else:
+                    break
+
+    # Fails if a local process has exited, showing its output
+    def check_processes(self):
+        for proc in self.processes:
+            if proc.poll() is not None:
+                eprint(read(proc.output_file), end="")
+                fail(f"Local {proc} exited with code {proc.exit_code}")
+
+    def stop(self):
+        for forwarder in self.forwarders:
+            forwarder.stop()
+
+        for proc in self.processes:
+            stop(proc, quiet=True)
+
+        self.forwarders.clear()
+        self.processes.clear()
+
+# Copies bytes in both directions between each accepted connection and
+# a new connection to the target port.  It runs an asyncio event loop
+# in a background thread.
+class TcpForwarder:
+    def __init__(self, listen_port, target_port, host="localhost"):
+        self.listen_port = listen_port
+        self.target_port = target_port
+        self.host = host
+
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    def __repr__(self):
+        return f"forwarder {self.listen_port} -> {self.target_port}"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        import asyncio
+
+        ready = threading.Event()
+        errors = list()
+
+        def run_loop():
+            self._loop = asyncio.new_event_loop()
+
+            try:
+                self._server = self._loop.run_until_complete(
+                    asyncio.start_server(self._handle, self.host, self.listen_port))
+            except OSError as e:
+                errors.append(e)
+                ready.set()
+                return
+
+            ready.set()
+
+            self._loop.run_forever()
+
+            self._server.close()
+
+            # Cancel the open connections so they don't outlive the loop
+            tasks = asyncio.all_tasks(self._loop)
+
+            for task in tasks:
+                task.cancel()
+
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.run_until_complete(self._server.wait_closed())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run_loop, name=repr(self), daemon=True)
+        self._thread.start()
+
+        ready.wait()
+
+        if errors:
+            fail(f"Failed to start {self}: {errors[0]}")
+
+    def stop(self):
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    async def _handle(self, client_reader, client_writer):
+        import asyncio
+
+        try:
+            target_reader, target_writer = await asyncio.open_connection(self.host, self.target_port)
+        except OSError:
+            client_writer.close()
+            return
+
+        async def pipe(reader, writer):
+            try:
+                while True:
+                    data = await reader.read(65536)
+
+                    if not data:
+                        break
 
-                if command.await_console_ok:
-                    await_console_ok()
+                    writer.write(data)
+                    await writer.drain()
+            except OSError:
+                pass
+            finally:
+                writer.close()
 
-                if command.await_port:
-                    await_port(command.await_port, timeout=300)
+        await asyncio.gather(pipe(client_reader, target_writer), pipe(target_reader, client_writer))
 
-                if command.run:
-                    proc = run(command.run.replace("~", work_dir), shell=True, check=False)
+# Prints a table of step durations by site and the slowest commands
+# and waits, and writes the full timeline to the work dir as JSON and
+# in the Chrome trace event format
+def report_timing(timeline, work_dir):
+    steps = [x for x in timeline.spans if x.kind == "step"]
 
-                    if command.expect_failure:
-                        if proc.exit_code == 0:
-                            fail("A command expected to fail did not fail")
+    if not steps:
+        return
+
+    site_names = list()
+    operations = list()
+
+    def find_operations(span, site_name):
+        if span.kind == "site":
+            site_name = span.name
+
+        if span.kind in ("run", "await"):
+            operations.append((span, site_name))
+            return
+
+        for child in span.children:
+            find_operations(child, site_name)
+
+    for step in steps:
+        for child in step.children:
+            if child.kind == "site" and child.name not in site_names:
+                site_names.append(child.name)
+
+        find_operations(step, None)
+
+    def format_seconds(span):
+        if span is None or span.duration is None:
+            return "-"
+
+        return "{:.1f}s".format(span.duration)
+
+    rows = [["Step", "Total", *site_names]]
+
+    for step in steps:
+        sites = {x.name: x for x in step.children if x.kind == "site"}
+        rows.append([step.name, format_seconds(step), *[format_seconds(sites.get(x)) for x in site_names]])
+
+    rows.append(["Total", "{:.1f}s".format(sum(x.duration or 0 for x in steps))] + [""] * len(site_names))
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+
+    print()
+    cprint("=== Timing ===", color="cyan")
+
+    for row in rows:
+        cells = [row[0].ljust(widths[0])] + [x.rjust(w) for x, w in zip(row[1:], widths[1:])]
+        print("  ".join(cells).rstrip())
 
-                        continue
+    print()
+    print("Slowest operations:")
+
+    operations.sort(key=lambda x: x[0].duration or 0, reverse=True)
+
+    for span, site_name in operations[:10]:
+        name = str(span.name).splitlines()[0]
 
-                    if check and proc.exit_code > 0:
-                        raise PlanoProcessError(proc)
+        if len(name) > 60:
+            name = name[:57] + "..."
+
+        print("  {:>7}  {:<5}  {:<8}  {}".format(format_seconds(span), span.kind, nvl(site_name, "-"), name))
+
+    print()
+
+    json_file = write_timeline_json(timeline, join(work_dir, "timing.json"))
+    trace_file = write_timeline_trace(timeline, join(work_dir, "timing-trace.json"))
+
+    notice(f"Timing data written to '{json_file}' and '{trace_file}'")
 
 def pause_for_demo(model):
     notice("Pausing for demo time")
@@ -280,7 +824,22 @@ def print_debug_output(model):
 
     print("-- End of debug output")
 
-def generate_readme(skewer_file, output_file):
+# force=False - Generate the output even if its inputs are unchanged
+# since the last time
+def generate_readme(skewer_file, output_file, force=False):
+    cache_file = join(get_user_temp_dir(), "skewer-cache", "readme.json")
+    cache_key = get_absolute_path(output_file)
+    digest = get_readme_digest(skewer_file, output_file)
+
+    try:
+        cache = read_json(cache_file)
+    except (FileNotFoundError, ValueError):
+        cache = dict()
+
+    if not force and cache.get(cache_key) == digest:
+        notice(f"Skipping the readme (output_file='{output_file}'); its inputs are unchanged")
+        return
+
     notice(f"Generating the readme (skewer_file='{skewer_file}', output_file='{output_file}')")
 
     model = Model(skewer_file)
@@ -371,6 +930,33 @@ def generate_readme(skewer_file, output_file):
 
     write(output_file, "\n".join(out).strip() + "\n")
 
+    cache = {k: v for k, v in cache.items() if exists(k)}
+    cache[cache_key] = get_readme_digest(skewer_file, output_file)
+
+    write_json(cache_file, cache)
+
+# The digest of the readme inputs and the current output, so a missing
+# or edited output is generated again.  The Skewer code and standard
+# text are inputs too.
+def get_readme_digest(skewer_file, output_file):
+    hash = hashlib.sha256()
+    skewer_dir = get_parent_dir(__file__)
+
+    for file in (skewer_file, output_file, join(skewer_dir, "main.py"), join(skewer_dir, "standardtext.yaml"),
+                 join(skewer_dir, "standardsteps.yaml")):
+        update_file_digest(hash, file)
+
+    return hash.hexdigest()
+
+def update_file_digest(hash, file):
+    if not is_file(file):
+        hash.update(b"\0")
+        return
+
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            hash.update(chunk)
+
 def generate_readme_step(model, step):
     notice(f"Generating {step}")
 
@@ -466,8 +1052,9 @@ def apply_standard_steps(model):
         apply_attribute("postamble")
 
         platform = standard_step_data.get("platform")
+        has_commands = "commands" in standard_step_data or "local_commands" in standard_step_data
 
-        if "commands" not in step.data and "commands" in standard_step_data:
+        if "commands" not in step.data and has_commands:
             step.data["commands"] = dict()
 
             for i, item in enumerate(dict(model.sites).items()):
@@ -476,13 +1063,20 @@ def apply_standard_steps(model):
                 if platform and site.platform != platform:
                     continue
 
-                if str(i) in standard_step_data["commands"]:
+                # Local sites can't run the Kubernetes and Skupper
+                # commands, so they use local equivalents if any
+                if site.platform == "local":
+                    standard_commands = standard_step_data.get("local_commands", dict())
+                else:
+                    standard_commands = standard_step_data.get("commands", dict())
+
+                if str(i) in standard_commands:
                     # Is a specific index in the standard commands?
-                    commands = standard_step_data["commands"][str(i)]
+                    commands = standard_commands[str(i)]
                     step.data["commands"][site_name] = resolve_command_variables(commands, site)
-                elif "*" in standard_step_data["commands"]:
+                elif "*" in standard_commands:
                     # Is "*" in the standard commands?
-                    commands = standard_step_data["commands"]["*"]
+                    commands = standard_commands["*"]
                     step.data["commands"][site_name] = resolve_command_variables(commands, site)
                 else:
                     # Otherwise, omit commands for this site
@@ -513,6 +1107,18 @@ def resolve_command_variables(commands, site):
     return resolved_commands
 
 def get_github_owner_repo():
+    current_dir = get_current_dir()
+
+    try:
+        return _github_owner_repo_cache[current_dir]
+    except KeyError:
+        pass
+
+    owner_repo = _github_owner_repo_cache[current_dir] = _get_github_owner_repo()
+
+    return owner_repo
+
+def _get_github_owner_repo():
     check_program("git")
 
     url = call("git remote get-url origin", quiet=True)
@@ -565,13 +1171,34 @@ class Model:
     next_steps = object_property("next_steps", standard_text["next_steps"])
     about_this_example = object_property("about_this_example", standard_text["about_this_example"])
 
-    def __init__(self, skewer_file, kubeconfigs=[]):
+    def __init__(self, skewer_file, kubeconfigs=[], platform=None):
         self.skewer_file = skewer_file
+        self.local = None
+
+        # Resolving the standard steps is the costly part, so reuse
+        # the result when the inputs are the same.  Callers modify
+        # the model data, so each model gets its own copy.
+        hash = hashlib.sha256(repr((get_absolute_path(skewer_file), list(kubeconfigs), platform)).encode("utf-8"))
+        update_file_digest(hash, skewer_file)
+        key = hash.hexdigest()
+
+        try:
+            self.data = deepcopy(_model_cache[key])
+            return
+        except KeyError:
+            pass
+
         self.data = read_yaml(self.skewer_file)
 
+        if platform is not None:
+            for site_data in self.data["sites"].values():
+                site_data["platform"] = platform
+
         apply_kubeconfigs(self, kubeconfigs)
         apply_standard_steps(self)
 
+        _model_cache[key] = deepcopy(self.data)
+
     def __repr__(self):
         return f"model '{self.skewer_file}'"
 
@@ -627,7 +1254,7 @@ class Site:
         check_required_attributes(self, "platform")
         check_unknown_attributes(self)
 
-        if self.platform not in ("kubernetes", "podman"):
+        if self.platform not in ("kubernetes", "podman", "local"):
             fail(f"{self} attribute 'platform' has an illegal value: {self.platform}")
 
         if self.platform == "kubernetes":
@@ -649,6 +1276,14 @@ class Site:
     def title(self):
         return self.data.get("title", capitalize(self.name))
 
+    # The current environment with the site variables applied, for
+    # running processes without changing the global environment
+    def get_process_env(self):
+        env = dict(ENV)
+        env.update((name, str(value)) for name, value in self.env.items())
+
+        return env
+
 class Step:
     numbered = object_property("numbered", True)
     name = object_property("name")
@@ -695,6 +1330,8 @@ class Command:
     await_http_ok = object_property("await_http_ok")
     await_console_ok = object_property("await_console_ok")
     await_port = object_property("await_port")
+    background = object_property("background", False)
+    forward = object_property("forward")
 
     def __init__(self, model, data):
         self.model = model
@@ -709,11 +1346,17 @@ class Command:
     def check(self):
         check_unknown_attributes(self)
 
+# reuse=False - Keep the cluster and tunnel between runs.  A reused
+# cluster is reset by deleting the site namespaces, and it is
+# recreated only if it fails a health check.
 class Minikube:
-    def __init__(self, skewer_file):
+    def __init__(self, skewer_file, reuse=False):
         self.skewer_file = skewer_file
+        self.reuse = reuse
         self.kubeconfigs = list()
         self.work_dir = join(get_user_temp_dir(), "skewer")
+        self.state_dir = join(get_user_temp_dir(), "skewer-minikube")
+        self.tunnel = None
 
     def __enter__(self):
         notice("Starting Minikube")
@@ -721,20 +1364,31 @@ class Minikube:
         check_environment()
         check_program("minikube")
 
-        profile_data = parse_json(call("minikube profile list --output json", quiet=True))
+        profile_exists = self.profile_exists()
 
-        for profile in profile_data.get("valid", []):
-            if profile["Name"] == "skewer":
-                fail("A Minikube profile 'skewer' already exists.  Delete it using 'minikube delete -p skewer'.")
+        if profile_exists and not self.reuse:
+            fail("A Minikube profile 'skewer' already exists.  Delete it using 'minikube delete -p skewer'.")
 
         remove(self.work_dir, quiet=True)
         make_dir(self.work_dir, quiet=True)
 
-        run("minikube start -p skewer --auto-update-drivers false")
+        reused = False
+
+        if profile_exists:
+            if self.is_healthy():
+                notice("Reusing the existing Minikube profile 'skewer'")
+                reused = True
+            else:
+                notice("The existing Minikube profile 'skewer' is not healthy.  Recreating it.")
+
+                self.stop_saved_tunnel()
+                run("minikube delete -p skewer")
+
+        if not reused:
+            run("minikube start -p skewer --auto-update-drivers false")
 
         try:
-            tunnel_output_file = open(f"{self.work_dir}/minikube-tunnel-output", "w")
-            self.tunnel = start("minikube tunnel -p skewer", output=tunnel_output_file)
+            self.start_tunnel()
 
             try:
                 model = Model(self.skewer_file)
@@ -751,18 +1405,105 @@ class Minikube:
                     with site:
                         run("minikube update-context -p skewer")
                         check_file(ENV["KUBECONFIG"])
+
+                        if reused:
+                            run(f"kubectl delete namespace {site.namespace} --ignore-not-found --wait=true")
             except:
-                stop(self.tunnel)
+                if not self.reuse:
+                    stop(self.tunnel)
+
                 raise
         except:
-            run("minikube delete -p skewer")
+            if not self.reuse:
+                run("minikube delete -p skewer")
+
             raise
 
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
+        if self.reuse:
+            notice("Keeping Minikube profile 'skewer' for reuse")
+            return
+
         notice("Stopping Minikube")
 
         stop(self.tunnel)
 
         run("minikube delete -p skewer")
+
+    def profile_exists(self):
+        profile_data = parse_json(call("minikube profile list --output json", quiet=True))
+
+        for profile in profile_data.get("valid", []):
+            if profile["Name"] == "skewer":
+                return True
+
+        return False
+
+    def is_healthy(self):
+        proc = run("minikube status -p skewer --output json", stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=False,
+                   quiet=True)
+
+        try:
+            status = parse_json(proc.stdout_result)
+        except ValueError:
+            return False
+
+        return all(status.get(x) == "Running" for x in ("Host", "Kubelet", "APIServer"))
+
+    def start_tunnel(self):
+        if not self.reuse:
+            tunnel_output_file = open(f"{self.work_dir}/minikube-tunnel-output", "w")
+            self.tunnel = start("minikube tunnel -p skewer", output=tunnel_output_file)
+            return
+
+        pid = self.get_saved_tunnel_pid()
+
+        if pid is not None:
+            notice(f"Reusing the Minikube tunnel (process {pid})")
+            return
+
+        make_dir(self.state_dir, quiet=True)
+
+        # Start the tunnel in its own session so it outlives this
+        # process and isn't interrupted along with it
+        with open(join(self.state_dir, "minikube-tunnel-output"), "w") as output:
+            proc = subprocess.Popen(["minikube", "tunnel", "-p", "skewer"], stdin=subprocess.DEVNULL,
+                                    stdout=output, stderr=subprocess.STDOUT, start_new_session=True)
+
+        write(join(self.state_dir, "tunnel-pid"), str(proc.pid))
+
+        notice(f"Started the Minikube tunnel (process {proc.pid})")
+
+    # Returns the PID of the saved tunnel process if it is still running
+    def get_saved_tunnel_pid(self):
+        pid_file = join(self.state_dir, "tunnel-pid")
+
+        if not exists(pid_file):
+            return None
+
+        pid = int(read(pid_file))
+
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return None
+
+        # Guard against the PID having been reused by another process
+        if which("ps"):
+            args = call(f"ps -o args= -p {pid}", quiet=True)
+
+            if "minikube" not in args or "tunnel" not in args:
+                return None
+
+        return pid
+
+    def stop_saved_tunnel(self):
+        pid = self.get_saved_tunnel_pid()
+
+        if pid is not None:
+            notice(f"Stopping the Minikube tunnel (process {pid})")
+            os.kill(pid, signal.SIGTERM)
+
+        remove(join(self.state_dir, "tunnel-pid"), quiet=True)
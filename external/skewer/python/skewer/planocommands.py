@@ -22,13 +22,17 @@ from plano.github import *
 from skewer import *
 
 _debug_param = CommandParameter("debug", help="Produce extra debug output on failure")
+_parallel_param = CommandParameter("parallel", help="Run the commands for each site concurrently")
+_local_param = CommandParameter("local", help="Run the sites as local processes instead of on Kubernetes")
+_reuse_param = CommandParameter("reuse", help="Keep the Minikube cluster between runs and reuse it")
+_force_param = CommandParameter("force", help="Generate the output even if its inputs are unchanged")
 
-@command
-def generate(output="README.md"):
+@command(parameters=[_force_param])
+def generate(output="README.md", force=False):
     """
     Generate README.md from the data in skewer.yaml
     """
-    generate_readme("skewer.yaml", output)
+    generate_readme("skewer.yaml", output, force=force)
 
 @command
 def render(quiet=False):
@@ -50,35 +54,40 @@ def clean():
     remove(find(".", "__pycache__"))
     remove("README.html")
 
-@command(parameters=[_debug_param])
-def run_(*kubeconfigs, debug=False):
+@command(parameters=[_debug_param, _parallel_param, _local_param, _reuse_param])
+def run_(*kubeconfigs, debug=False, parallel=False, local=False, reuse=False):
     """
     Run the example steps
 
     If no kubeconfigs are provided, Skewer starts a local Minikube
-    instance and runs the steps using it.
+    instance and runs the steps using it.  With --local, the sites
+    run as processes on this machine instead.  With --reuse, the
+    Minikube instance is kept for the next run.
     """
-    if not kubeconfigs:
-        with Minikube("skewer.yaml") as mk:
-            run_steps("skewer.yaml", kubeconfigs=mk.kubeconfigs, work_dir=mk.work_dir, debug=debug)
+    if local:
+        run_steps("skewer.yaml", debug=debug, parallel=parallel, platform="local")
+    elif not kubeconfigs:
+        with Minikube("skewer.yaml", reuse=reuse) as mk:
+            run_steps("skewer.yaml", kubeconfigs=mk.kubeconfigs, work_dir=mk.work_dir, debug=debug,
+                      parallel=parallel)
     else:
-        run_steps("skewer.yaml", kubeconfigs=kubeconfigs, debug=debug)
+        run_steps("skewer.yaml", kubeconfigs=kubeconfigs, debug=debug, parallel=parallel)
 
-@command(parameters=[_debug_param])
-def demo(*kubeconfigs, debug=False):
+@command(parameters=[_debug_param, _parallel_param, _local_param, _reuse_param])
+def demo(*kubeconfigs, debug=False, parallel=False, local=False, reuse=False):
     """
     Run the example steps and pause for a demo before cleaning up
     """
     with working_env(SKEWER_DEMO=1):
-        run_(*kubeconfigs, debug=debug)
+        run_(*kubeconfigs, debug=debug, parallel=parallel, local=local, reuse=reuse)
 
-@command(parameters=[_debug_param])
-def test_(debug=False):
+@command(parameters=[_debug_param, _reuse_param])
+def test_(debug=False, reuse=False):
     """
     Test README generation and run the steps on Minikube
     """
     generate(output=make_temp_file())
-    run_(debug=debug)
+    run_(debug=debug, reuse=reuse)
 
 @command
 def update_skewer():
@@ -0,0 +1,183 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import asyncio
+import random
+
+from plano import *
+
+from .main import TcpForwarder
+
+__all__ = [
+    "WanProxy",
+]
+
+_distributions = ("constant", "uniform", "normal", "exponential")
+
+# A TCP forwarder that simulates a wide-area network hop.  Each chunk
+# of data is held for a sampled one-way delay, and new connections
+# pay one round trip before they reach the target.  Delivery order is
+# preserved.
+#
+# latency=0 - The mean one-way delay in seconds
+# jitter=0 - The spread of the delay in seconds: the half-width for
+#   "uniform", the standard deviation for "normal", and the mean of
+#   the added tail for "exponential"
+# distribution="normal" - "constant", "uniform", "normal", or "exponential"
+# bandwidth=None - The throughput cap in bytes per second for each
+#   direction, shared by all connections
+# failure_rate=0 - The chance that each chunk of data drops its
+#   connection instead of being delivered
+# seed=None - Seed the random choices for repeatable runs
+class WanProxy(TcpForwarder):
+    def __init__(self, listen_port, target_port, host="localhost", latency=0, jitter=0, distribution="normal",
+                 bandwidth=None, failure_rate=0, seed=None):
+        super().__init__(listen_port, target_port, host=host)
+
+        if distribution not in _distributions:
+            fail(f"Unknown delay distribution '{distribution}'.  Choose one of {', '.join(_distributions)}.")
+
+        self.latency = latency
+        self.jitter = jitter
+        self.distribution = distribution
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+
+        self.connections = 0
+        self.dropped_connections = 0
+
+        self._random = random.Random(seed)
+        self._links = {"request": _Link(bandwidth), "response": _Link(bandwidth)}
+
+    def __repr__(self):
+        return f"WAN proxy {self.listen_port} -> {self.target_port}"
+
+    def sample_delay(self):
+        if self.distribution == "constant" or not self.jitter:
+            delay = self.latency
+        elif self.distribution == "uniform":
+            delay = self._random.uniform(self.latency - self.jitter, self.latency + self.jitter)
+        elif self.distribution == "normal":
+            delay = self._random.gauss(self.latency, self.jitter)
+        elif self.distribution == "exponential":
+            delay = self.latency + self._random.expovariate(1 / self.jitter)
+
+        return max(0, delay)
+
+    async def _handle(self, client_reader, client_writer):
+        self.connections += 1
+
+        # The handshake with the far side costs a round trip
+        await asyncio.sleep(self.sample_delay() + self.sample_delay())
+
+        try:
+            target_reader, target_writer = await asyncio.open_connection(self.host, self.target_port)
+        except OSError:
+            client_writer.close()
+            return
+
+        try:
+            await asyncio.gather(self._pipe(client_reader, target_writer, self._links["request"]),
+                                 self._pipe(target_reader, client_writer, self._links["response"]))
+        except _ConnectionDropped:
+            self.dropped_connections += 1
+
+            # Reset both sides, as a failed network path would
+            client_writer.transport.abort()
+            target_writer.transport.abort()
+
+    async def _pipe(self, reader, writer, link):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=64)
+        broken = False
+
+        async def deliver():
+            nonlocal broken
+
+            while True:
+                item = await queue.get()
+
+                if item is None:
+                    return
+
+                # Keep taking chunks after a failure so the reader
+                # never blocks on a full queue
+                if broken:
+                    continue
+
+                delivery_time, data = item
+
+                await asyncio.sleep(delivery_time - loop.time())
+
+                try:
+                    writer.write(data)
+                    await writer.drain()
+                except OSError:
+                    broken = True
+
+        delivery = asyncio.create_task(deliver())
+        delivery_time = 0
+
+        try:
+            while not broken:
+                data = await reader.read(16384)
+
+                if not data:
+                    break
+
+                if self.failure_rate and self._random.random() < self.failure_rate:
+                    raise _ConnectionDropped()
+
+                # Wait for the link to send the chunk, then let it
+                # travel.  A chunk never overtakes the one before it.
+                sent_time = link.transmit(loop.time(), len(data))
+
+                await asyncio.sleep(sent_time - loop.time())
+
+                delivery_time = max(sent_time + self.sample_delay(), delivery_time)
+
+                await queue.put((delivery_time, data))
+
+            if not broken:
+                await queue.put(None)
+                await delivery
+        except OSError:
+            pass
+        finally:
+            delivery.cancel()
+            writer.close()
+
+# A link with a throughput cap.  Chunks are sent one after another,
+# each taking its size divided by the bandwidth.
+class _Link:
+    def __init__(self, bandwidth):
+        self.bandwidth = bandwidth
+        self.free_time = 0
+
+    # Returns the time the chunk is fully sent
+    def transmit(self, now, size):
+        if not self.bandwidth:
+            return now
+
+        self.free_time = max(now, self.free_time) + size / self.bandwidth
+
+        return self.free_time
+
+class _ConnectionDropped(Exception):
+    pass
@@ -17,6 +17,8 @@
 # under the License.
 #
 
+import sys as _sys
+
 from plano import *
 from skewer import *
 
@@ -42,12 +44,367 @@ def generate_readme_():
         generate_readme("skewer.yaml", "README.md")
         check_file("README.md")
 
+_stub_kubectl = """
+#!/usr/bin/env python3
+
+import json, os, sys, time
+
+def deployment(name, available):
+    status = "True" if available else "False"
+    return {"kind": "Deployment", "metadata": {"name": name},
+            "status": {"conditions": [{"type": "Available", "status": status}]}}
+
+def service(name, ingress):
+    ingress = [{"ip": "10.0.0.1"}] if ingress else []
+    return {"kind": "Service", "metadata": {"name": name}, "status": {"loadBalancer": {"ingress": ingress}}}
+
+def emit(*items):
+    for item in items:
+        print(json.dumps(item, indent=4), flush=True)
+
+args = sys.argv[1:]
+
+if "--watch" in args:
+    if os.environ.get("STUB_KUBECTL_NO_WATCH"):
+        sys.exit(1)
+
+    if args[1] == "deployment":
+        emit(deployment("frontend", False), deployment("backend", True))
+        time.sleep(0.2)
+        emit(deployment("frontend", True))
+    elif args[1] == "service":
+        emit(service("frontend", False))
+        time.sleep(0.2)
+        emit(service("frontend", True))
+
+    time.sleep(60)
+else:
+    with open("kubectl-calls", "a") as f:
+        f.write("x")
+
+    with open("kubectl-calls") as f:
+        calls = len(f.read())
+
+    if calls < 3:
+        sys.exit(1)
+
+    emit(deployment("frontend", True))
+""".lstrip()
+
+@test
+def readme_cache():
+    from skewer.main import Model, get_github_owner_repo
+
+    with working_dir():
+        write("skewer.yaml", emit_yaml({
+            "title": "Cache",
+            "workflow": "main.yaml",
+            "sites": {"west": {"platform": "kubernetes", "namespace": "west", "env": {"KUBECONFIG": "~/config-west"}}},
+            "steps": [{"standard": "kubernetes/set_up_your_clusters"}],
+        }))
+
+        run("git init -q")
+        run("git remote add origin git@github.com:owner/repo.git")
+
+        with working_env(XDG_RUNTIME_DIR=make_dir("runtime")):
+            generate_readme("skewer.yaml", "README.md")
+            assert "owner/repo" in read("README.md")
+
+            # The owner and repo names are memoized
+            run("git remote set-url origin git@github.com:other/repo.git")
+            assert get_github_owner_repo() == ["owner", "repo"]
+
+            # Unchanged inputs skip generation
+            with expect_output(contains="Skipping the readme") as out:
+                with logging_enabled(output=out):
+                    generate_readme("skewer.yaml", "README.md")
+
+            # Changed inputs or a changed output generate it again
+            write("skewer.yaml", read("skewer.yaml").replace("Cache", "Changed"))
+            generate_readme("skewer.yaml", "README.md")
+            assert "# Changed" in read("README.md")
+
+            append("README.md", "Edited\n")
+            generate_readme("skewer.yaml", "README.md")
+            assert "Edited" not in read("README.md")
+
+        # Each model gets its own copy of the cached data
+        model = Model("skewer.yaml", kubeconfigs=["/tmp/one"])
+        site = dict(model.sites)["west"]
+        site.env["KUBECONFIG"] = "/tmp/two"
+
+        model = Model("skewer.yaml", kubeconfigs=["/tmp/one"])
+        assert dict(model.sites)["west"].env["KUBECONFIG"] == "/tmp/one"
+
+@test
+def await_operations():
+    from skewer.main import await_ingress, await_resource, await_resources
+
+    with working_dir():
+        write("bin/kubectl", _stub_kubectl)
+        run("chmod +x bin/kubectl")
+
+        with working_env(PATH=f"{get_absolute_path('bin')}:{ENV['PATH']}"):
+            with Timer() as timer:
+                result = await_resources(["deployment/frontend", "deployment/backend", "service/frontend"])
+
+            assert set(result) == {"deployment/frontend", "deployment/backend", "service/frontend"}, result
+            assert timer.elapsed_time < 5, timer.elapsed_time
+
+            result = await_ingress("service/frontend")
+            assert result == "10.0.0.1", result
+
+            with expect_error():
+                await_resources(["deployment/nothing"], timeout=0.5)
+
+            # Without watch support, fall back to polling
+            with working_env(STUB_KUBECTL_NO_WATCH=1):
+                with Timer() as timer:
+                    await_resource("deployment/frontend")
+
+                assert read("kubectl-calls") == "xxx", read("kubectl-calls")
+                assert timer.elapsed_time < 5, timer.elapsed_time
+
+@test
+def timing_report():
+    from skewer.main import Model, report_timing, run_step
+
+    with working_dir():
+        write("skewer.yaml", emit_yaml({
+            "title": "Timing",
+            "sites": {
+                "west": {"platform": "podman", "env": {"SKUPPER_PLATFORM": "podman"}},
+                "east": {"platform": "podman", "env": {"SKUPPER_PLATFORM": "podman"}},
+            },
+            "steps": [
+                {"title": "One", "commands": {"west": [{"run": "sleep 0.1"}], "east": [{"run": "true"}]}},
+                {"title": "Two", "commands": {"east": [{"run": "true"}]}},
+            ],
+        }))
+
+        model = Model("skewer.yaml")
+        model.check()
+
+        with Timeline() as timeline:
+            for step in model.steps:
+                run_step(model, step, get_current_dir(), parallel=True)
+
+        with expect_output(contains="Slowest operations") as out:
+            with output_redirected(out, quiet=True):
+                report_timing(timeline, "work")
+
+        data = read_json("work/timing.json")
+        assert [x["name"] for x in data["spans"]] == ["One", "Two"], data
+        assert sorted(x["name"] for x in data["spans"][0]["children"]) == ["east", "west"], data
+
+        data = read_json("work/timing-trace.json")
+        assert "'sleep 0.1'" in [x["name"] for x in data["traceEvents"]], data
+
+        # A failure to write the report doesn't hide the step failure
+        write("fail.yaml", emit_yaml({
+            "title": "Failing",
+            "sites": {"west": {"platform": "local"}},
+            "steps": [{"title": "Fail", "commands": {"west": [{"run": "false"}]}}],
+        }))
+
+        make_dir("broken/timing.json")
+
+        with expect_error():
+            run_steps("fail.yaml", work_dir="broken")
+
+@test
+def local_platform():
+    with working_dir():
+        make_dir("site")
+        write("site/index.html", "Hello\n")
+
+        write("skewer.yaml", emit_yaml({
+            "title": "Local",
+            "sites": {
+                "west": {"platform": "kubernetes", "namespace": "west", "env": {"KUBECONFIG": "~/config-west"}},
+                "east": {"platform": "kubernetes", "namespace": "east", "env": {"KUBECONFIG": "~/config-east"}},
+            },
+            "steps": [
+                {"title": "Start", "commands": {
+                    "east": [{"run": f"exec {_sys.executable} -m http.server --bind localhost --directory site @port:server@",
+                              "background": True}],
+                }},
+                {"title": "Link", "commands": {
+                    "east": [{"await_resource": "deployment/server"},
+                             {"forward": ["@port:link@", "@port:server@"]}],
+                }},
+                {"title": "Check", "commands": {
+                    "west": [{"await_http_ok": ["service/link", "http://{}:@port:link@/index.html"]},
+                             {"run": "curl -sf http://localhost:@port:link@/index.html | grep Hello"}],
+                }},
+            ],
+        }))
+
+        run_steps("skewer.yaml", work_dir=make_dir("work"), platform="local")
+
+        with expect_error():
+            write("fail.yaml", emit_yaml({
+                "title": "Local",
+                "sites": {"west": {"platform": "local"}},
+                "steps": [
+                    {"title": "Start", "commands": {"west": [{"run": "exit 1 # @port:broken@", "background": True},
+                                                             {"await_resource": "deployment/broken"}]}},
+                ],
+            }))
+
+            run_steps("fail.yaml", work_dir=make_dir("work"))
+
+_stub_minikube = """
+#!/usr/bin/env python3
+
+import json, os, sys, time
+
+state = os.environ["STUB_MINIKUBE_STATE"]
+args = sys.argv[1:]
+
+with open(os.path.join(state, "minikube-calls"), "a") as f:
+    f.write(args[0] + "\\n")
+
+if args[0] == "profile":
+    names = ["skewer"] if os.path.exists(os.path.join(state, "profile")) else []
+    print(json.dumps({"valid": [{"Name": x} for x in names]}))
+elif args[0] == "start":
+    open(os.path.join(state, "profile"), "w").close()
+elif args[0] == "delete":
+    os.remove(os.path.join(state, "profile"))
+elif args[0] == "status":
+    status = "Stopped" if os.environ.get("STUB_MINIKUBE_STOPPED") else "Running"
+    print(json.dumps({"Host": status, "Kubelet": status, "APIServer": status}))
+elif args[0] == "update-context":
+    open(os.environ["KUBECONFIG"], "w").close()
+elif args[0] == "tunnel":
+    time.sleep(60)
+""".lstrip()
+
+@test
+def minikube_reuse():
+    with working_dir():
+        write("bin/minikube", _stub_minikube)
+        write("bin/kubectl", "#!/bin/sh\necho \"$@\" >> \"$STUB_MINIKUBE_STATE/kubectl-calls\"\n")
+        write("bin/skupper", "#!/bin/sh\n")
+        run("chmod +x bin/minikube bin/kubectl bin/skupper")
+
+        write("skewer.yaml", emit_yaml({
+            "title": "Reuse",
+            "sites": {
+                "west": {"platform": "kubernetes", "namespace": "west", "env": {"KUBECONFIG": "~/config-west"}},
+                "east": {"platform": "kubernetes", "namespace": "east", "env": {"KUBECONFIG": "~/config-east"}},
+            },
+            "steps": [],
+        }))
+
+        state = make_dir("state")
+
+        def calls():
+            return read("state/minikube-calls").split()
+
+        with working_env(PATH=f"{get_absolute_path('bin')}:{ENV['PATH']}", XDG_RUNTIME_DIR=make_dir("runtime"),
+                         STUB_MINIKUBE_STATE=get_absolute_path(state)):
+            with Minikube("skewer.yaml", reuse=True) as mk:
+                assert len(mk.kubeconfigs) == 2, mk.kubeconfigs
+
+            tunnel_pid = mk.get_saved_tunnel_pid()
+
+            try:
+                assert tunnel_pid is not None
+                assert "start" in calls(), calls()
+                assert "delete" not in calls(), calls()
+                assert not exists("state/kubectl-calls")
+
+                # A healthy profile is reset, not recreated, and the
+                # tunnel is still running
+
+                remove("state/minikube-calls")
+
+                with Minikube("skewer.yaml", reuse=True) as mk:
+                    pass
+
+                assert "start" not in calls(), calls()
+                assert "tunnel" not in calls(), calls()
+                assert mk.get_saved_tunnel_pid() == tunnel_pid
+
+                kubectl_calls = read("state/kubectl-calls")
+                assert "delete namespace west" in kubectl_calls, kubectl_calls
+                assert "delete namespace east" in kubectl_calls, kubectl_calls
+
+                # Without reuse, an existing profile is an error
+
+                with expect_error():
+                    with Minikube("skewer.yaml"):
+                        pass
+
+                # An unhealthy profile is recreated with a new tunnel
+
+                remove("state/minikube-calls")
+
+                with working_env(STUB_MINIKUBE_STOPPED=1):
+                    with Minikube("skewer.yaml", reuse=True) as mk:
+                        pass
+
+                assert calls().index("delete") < calls().index("start"), calls()
+
+                new_tunnel_pid = mk.get_saved_tunnel_pid()
+                assert new_tunnel_pid not in (None, tunnel_pid), new_tunnel_pid
+            finally:
+                mk.stop_saved_tunnel()
+
+@test
+def wan_proxy():
+    from skewer.proxy import WanProxy
+
+    with working_dir():
+        write("site/index.html", "x" * 100_000)
+
+        server_port = get_random_port()
+        proxy_port = get_random_port()
+        url = f"http://localhost:{proxy_port}/index.html"
+
+        with start(f"{_sys.executable} -m http.server --bind localhost --directory site {server_port}"):
+            await_port(server_port)
+
+            # A round trip for the handshake and one for the request
+            with WanProxy(proxy_port, server_port, latency=0.05, distribution="constant") as proxy:
+                with Timer() as timer:
+                    assert len(http_get(url)) == 100_000
+
+                assert timer.elapsed_time >= 0.2, timer.elapsed_time
+                assert proxy.connections == 1, proxy.connections
+
+            with WanProxy(proxy_port, server_port, bandwidth=200_000) as proxy:
+                with Timer() as timer:
+                    http_get(url)
+
+                assert timer.elapsed_time >= 0.5, timer.elapsed_time
+
+            with WanProxy(proxy_port, server_port, latency=0.01, jitter=0.01, seed=1) as proxy:
+                assert len(http_get(url)) == 100_000
+
+            with WanProxy(proxy_port, server_port, failure_rate=1) as proxy:
+                with expect_error():
+                    http_get(url)
+
+                assert proxy.dropped_connections == 1, proxy.dropped_connections
+
+            with expect_error():
+                WanProxy(proxy_port, server_port, distribution="lumpy")
+
 @test
 def run_steps_():
     with working_dir("example"):
         with Minikube("skewer.yaml") as mk:
             run_steps("skewer.yaml", kubeconfigs=mk.kubeconfigs, work_dir=mk.work_dir, debug=True)
 
+@test
+def run_steps_parallel():
+    with working_dir("example"):
+        with Minikube("skewer.yaml") as mk:
+            run_steps("skewer.yaml", kubeconfigs=mk.kubeconfigs, work_dir=mk.work_dir, debug=True, parallel=True)
+
 @test
 def run_steps_demo():
     with working_dir("example"):
@@ -55,6 +55,10 @@ def test():
         print()
         print(http_post_json("http://localhost:8080/api/hello", {"name": "Obtuse Ocelot", "text": "Bon jour"}))
         print()
+        print(http_get_json("http://localhost:8080/api/stats"))
+        print()
+        print(http_get("http://localhost:8080/api/data/export"))
+        print()
 
 
 @command
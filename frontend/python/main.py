@@ -20,43 +20,244 @@
 import animalid
 import argparse
 import asyncio
+import bisect
 import os
 import json
+import math
+import ratelimit
+import sketch
+import socket
+import time
 import uuid
 import uvicorn
+import zlib
 
-from httpx import AsyncClient, HTTPError
-from sse_starlette.sse import EventSourceResponse
 from starlette.applications import Starlette
-from starlette.responses import FileResponse, JSONResponse, Response
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from starlette.staticfiles import StaticFiles
+from starlette.websockets import WebSocketDisconnect
 
 process_id = f"frontend-{uuid.uuid4().hex[:8]}"
 records = list()
 
+# Greeting counts and round-trip latencies, keyed on the backend name
+# and pod
+backend_stats = dict()
+error_count = 0
+
+# The stats summary, shared by all clients until the stats change
+stats_summary = None
+
+# The number of records encoded at a time by the export
+export_chunk_size = 1000
+
+# How long notification clients wait before reconnecting, in
+# milliseconds
+reconnect_delay = 1000
+
+# How long to wait for requests in progress at shutdown, in seconds
+drain_timeout = 10
+
+# The number of backend calls in progress
+backend_calls = 0
+
+# The number of notification streams still sending
+notification_streams = 0
+
+# Greetings allowed per second for each client, with bursts up to
+# rate_limit_burst.  Clients are told apart by "address" or "name".
+rate_limit = 10
+rate_limit_burst = 20
+rate_limit_key = "address"
+
+# The pooled connections to the backend, created on first use
+http_client = None
+
 async def startup():
-    global change_event
+    global main_loop, change_event, drain_event, backend_calls_done, notification_streams_done, hello_limiter
+
+    main_loop = asyncio.get_running_loop()
     change_event = asyncio.Event()
+    drain_event = asyncio.Event()
+    backend_calls_done = asyncio.Event()
+    notification_streams_done = asyncio.Event()
+
+    hello_limiter = ratelimit.RateLimiter(rate_limit, rate_limit_burst) if rate_limit > 0 else None
+
+async def shutdown():
+    # Let the backend calls that are still running finish, up to the
+    # drain deadline, before closing the pooled connections
+    timeout = max(0, drain_deadline - main_loop.time()) if drain_event.is_set() else 0
+
+    if backend_calls:
+        backend_calls_done.clear()
+
+        try:
+            await asyncio.wait_for(backend_calls_done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    if http_client is not None:
+        await http_client.aclose()
+
+# Stop taking new greetings, and wake the notification streams and
+# WebSockets so they can tell their clients to go elsewhere
+def begin_drain():
+    global drain_deadline
 
-star = Starlette(debug=True, on_startup=[startup])
+    if drain_event.is_set():
+        return
+
+    drain_deadline = main_loop.time() + drain_timeout
+
+    drain_event.set()
+    change_event.set()
+    change_event.clear()
+
+# Returns 0 if the client may send a greeting now, or otherwise the
+# seconds until it may
+def check_rate_limit(address, name):
+    if hello_limiter is None:
+        return 0
+
+    return hello_limiter.acquire(name if rate_limit_key == "name" else address)
+
+def draining_response():
+    return JSONResponse({"error": "The frontend is shutting down"}, 503, headers={"Retry-After": "1"})
+
+star = Starlette(debug=True, on_startup=[startup], on_shutdown=[shutdown])
 star.mount("/static", StaticFiles(directory="static"), name="static")
 
 @star.route("/")
 async def index(request):
     return FileResponse("static/index.html")
 
+# after=<id> - Return only the records with greater IDs
 @star.route("/api/data")
 async def data(request):
-    return JSONResponse(records);
+    try:
+        after = max(0, int(request.query_params.get("after", 0)))
+    except ValueError as e:
+        return JSONResponse({"error": f"Illegal filter value: {e}"}, 400)
+
+    # IDs start at 1 and match the record positions
+    return JSONResponse(records[after:]);
+
+# Stream the records as newline-delimited JSON, gzipped if the client
+# accepts it.  The records are encoded a chunk at a time, and other
+# requests get a turn between chunks.
+#
+# after=<id> - Only records with greater IDs
+# since=<seconds> - Only records at or after this Unix time
+# until=<seconds> - Only records at or before this Unix time
+@star.route("/api/data/export")
+async def export_data(request):
+    try:
+        after = max(0, int(request.query_params.get("after", 0)))
+        since = float(request.query_params.get("since", "-inf"))
+        until = float(request.query_params.get("until", "inf"))
+    except ValueError as e:
+        return JSONResponse({"error": f"Illegal filter value: {e}"}, 400)
+
+    # Records are in time order (see get_record_time), so the time
+    # filters are ranges.  The export covers the records that exist
+    # now.
+    start = bisect.bisect_left(records, since, lo=after, key=lambda x: x["time"])
+    end = bisect.bisect_right(records, until, lo=start, key=lambda x: x["time"])
+
+    gzip = accepts_gzip(request.headers.get("accept-encoding", ""))
+
+    async def generate():
+        # wbits 31 produces the gzip format
+        compressor = zlib.compressobj(wbits=31) if gzip else None
+
+        for chunk_start in range(start, end, export_chunk_size):
+            chunk = records[chunk_start:min(chunk_start + export_chunk_size, end)]
+            data = "".join(json.dumps(x) + "\n" for x in chunk).encode("utf-8")
+
+            if compressor is not None:
+                data = compressor.compress(data)
+
+            if data:
+                yield data
+
+            await asyncio.sleep(0)
+
+        if compressor is not None:
+            yield compressor.flush()
+
+    headers = {"Vary": "Accept-Encoding"}
+
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson", headers=headers)
+
+# Returns true if an Accept-Encoding header allows gzip.  A coding
+# with q=0 is refused.
+def accepts_gzip(header):
+    qualities = dict()
+
+    for item in header.split(","):
+        coding, *params = item.split(";")
+        quality = 1.0
+
+        for param in params:
+            name, _, value = param.partition("=")
+
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        qualities[coding.strip().lower()] = quality
+
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+@star.route("/api/stats")
+async def stats(request):
+    return JSONResponse(get_stats())
 
 @star.route("/api/notifications")
 async def notifications(request):
+    # Imported here to keep it out of startup
+    from sse_starlette.sse import EventSourceResponse
+
     async def generate():
-        while True:
+        # Tell the client how soon to reconnect, in case the stream
+        # ends without warning
+        yield {"retry": reconnect_delay}
+
+        while not drain_event.is_set():
             await change_event.wait()
+
+            if drain_event.is_set():
+                break
+
             yield {"data": "1"}
 
-    return EventSourceResponse(generate())
+        # End the stream so the client reconnects to another frontend
+        yield {"retry": reconnect_delay}
+
+    response = EventSourceResponse(generate())
+
+    # Count the stream until its response is complete, so the server
+    # can wait for it at shutdown
+    async def send_response(scope, receive, send):
+        global notification_streams
+
+        notification_streams += 1
+
+        try:
+            await response(scope, receive, send)
+        finally:
+            notification_streams -= 1
+
+            if notification_streams == 0:
+                notification_streams_done.set()
+
+    return send_response
 
 @star.route("/api/generate-id", methods=["POST"])
 async def generate_id(request):
@@ -71,14 +272,147 @@ async def generate_id(request):
 
 @star.route("/api/hello", methods=["POST"])
 async def hello(request):
+    if drain_event.is_set():
+        return draining_response()
+
     request_data = await request.json()
 
-    name = request_data["name"]
-    text = request_data["text"]
+    address = request.client.host if request.client else None
+    retry_after = check_rate_limit(address, request_data["name"])
+
+    if retry_after:
+        return JSONResponse({"error": "Too many greetings"}, 429,
+                            headers={"Retry-After": str(math.ceil(retry_after))})
+
+    record = await say_hello(request_data["name"], request_data["text"])
+
+    return JSONResponse(record["response"])
+
+# Greetings, their responses, and new records all travel over one
+# connection.  Messages are JSON objects with a "type" field.
+#
+# Client to server:
+#   {"type": "hello", "id": <any>, "name": <str>, "text": <str>}
+#
+# Server to client:
+#   {"type": "records", "records": [<record>, ...]}  - All records, once on connect
+#   {"type": "record", "record": <record>}           - Each new record
+#   {"type": "stats", "stats": <stats>}               - After the records change
+#   {"type": "hello", "id": <any>, "response": <data>, "error": <str>}
+#     - With "retry_after": <seconds> if the client is over its rate limit
+#   {"type": "error", "error": <str>}                 - For a message that isn't understood
+@star.websocket_route("/api/ws")
+async def ws(websocket):
+    await websocket.accept()
+
+    address = websocket.client.host if websocket.client else None
+    send_lock = asyncio.Lock()
+    hello_tasks = set()
+
+    async def send(message):
+        async with send_lock:
+            await websocket.send_json(message)
+
+    async def push_records():
+        snapshot = list(records)
+        sent = len(snapshot)
+
+        await send({"type": "records", "records": snapshot})
+        await send({"type": "stats", "stats": get_stats()})
+
+        while not drain_event.is_set():
+            while sent == len(records) and not drain_event.is_set():
+                await change_event.wait()
+
+            for record in records[sent:]:
+                await send({"type": "record", "record": record})
+                sent += 1
+
+            await send({"type": "stats", "stats": get_stats()})
+
+        # Finish the greetings in progress, then ask the client to
+        # reconnect elsewhere.  1012 means "service restart".
+        await asyncio.gather(*hello_tasks, return_exceptions=True)
+        await websocket.close(code=1012)
+
+    async def handle_hello(message):
+        record = await say_hello(message["name"], message["text"])
+
+        await send({
+            "type": "hello",
+            "id": message.get("id"),
+            "response": record["response"],
+            "error": record["error"],
+        })
+
+    push_task = asyncio.create_task(push_records())
+
+    try:
+        while True:
+            frame = await websocket.receive()
+
+            if frame["type"] == "websocket.disconnect":
+                break
+
+            if frame.get("text") is None:
+                await send({"type": "error", "error": "Illegal message: Not a text frame"})
+                continue
+
+            try:
+                message = json.loads(frame["text"])
+            except ValueError as e:
+                await send({"type": "error", "error": f"Illegal message: {e}"})
+                continue
+
+            if not isinstance(message, dict):
+                await send({"type": "error", "error": "Illegal message: Not a JSON object"})
+                continue
+
+            if message.get("type") != "hello":
+                await send({"type": "error", "error": f"Unknown message type: {message.get('type')}"})
+                continue
+
+            if drain_event.is_set():
+                await send({"type": "hello", "id": message.get("id"), "response": None,
+                            "error": "The frontend is shutting down"})
+                continue
+
+            # Check once here so the rate limit and handle_hello can
+            # trust the fields
+            if not isinstance(message.get("name"), str) or not isinstance(message.get("text"), str):
+                await send({"type": "hello", "id": message.get("id"), "response": None,
+                            "error": "The name and text must be strings"})
+                continue
+
+            retry_after = check_rate_limit(address, message["name"])
+
+            if retry_after:
+                await send({"type": "hello", "id": message.get("id"), "response": None,
+                            "error": "Too many greetings", "retry_after": retry_after})
+                continue
+
+            # Handle greetings concurrently, as with separate POSTs
+            task = asyncio.create_task(handle_hello(message))
+            hello_tasks.add(task)
+            task.add_done_callback(hello_tasks.discard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        push_task.cancel()
+
+        for task in hello_tasks:
+            task.cancel()
+
+async def say_hello(name, text):
+    start_time = time.monotonic()
 
     backend_request, backend_response, backend_error = await send_greeting(name, text)
 
+    update_stats(backend_response, time.monotonic() - start_time)
+
     record = {
+        "id": len(records) + 1,
+        "time": get_record_time(),
         "request": backend_request,
         "response": backend_response,
         "error": backend_error,
@@ -89,19 +423,111 @@ async def hello(request):
     change_event.set()
     change_event.clear()
 
-    return JSONResponse(backend_response)
+    return record
+
+# The wall clock time for a new record.  If the clock steps back, this
+# holds at the last record's time until the clock catches up, so the
+# records stay in time order for the export.
+def get_record_time():
+    now = time.time()
+
+    return max(now, records[-1]["time"]) if records else now
+
+def update_stats(response_data, latency):
+    global error_count, stats_summary
+
+    stats_summary = None
+
+    if response_data is None:
+        error_count += 1
+        return
+
+    key = response_data["name"], response_data.get("pod")
+
+    try:
+        latencies = backend_stats[key]
+    except KeyError:
+        latencies = backend_stats[key] = sketch.QuantileSketch()
+
+    latencies.add(latency)
+
+# Merging the sketches costs time for each bucket, so do it once per
+# change instead of once per client
+def get_stats():
+    global stats_summary
+
+    if stats_summary is None:
+        stats_summary = summarize_stats()
+
+    return stats_summary
+
+def summarize_stats():
+    all_latencies = sketch.QuantileSketch()
+    backends = list()
+
+    for latencies in backend_stats.values():
+        all_latencies.merge(latencies)
+
+    for (name, pod), latencies in sorted(backend_stats.items(), key=lambda x: -x[1].count):
+        backends.append({
+            "name": name,
+            "pod": pod,
+            "count": latencies.count,
+            "share": latencies.count / all_latencies.count,
+            "latency": summarize_latencies(latencies),
+        })
+
+    return {
+        "count": all_latencies.count,
+        "errors": error_count,
+        "latency": summarize_latencies(all_latencies),
+        "backends": backends,
+    }
+
+# In milliseconds
+def summarize_latencies(latencies):
+    def millis(value):
+        return None if value is None else round(value * 1000, 1)
+
+    return {
+        "mean": millis(latencies.mean),
+        "p50": millis(latencies.quantile(0.5)),
+        "p90": millis(latencies.quantile(0.9)),
+        "p99": millis(latencies.quantile(0.99)),
+        "max": millis(latencies.max),
+    }
+
+# Imported here to keep httpx out of startup
+def get_http_client():
+    global http_client
+
+    if http_client is None:
+        from httpx import AsyncClient
+        http_client = AsyncClient()
+
+    return http_client
 
 async def send_greeting(name, text):
+    from httpx import HTTPError
+
     request_data = {
         "name": name,
         "text": text,
     }
 
-    async with AsyncClient() as client:
-        try:
-            response = await client.post(f"{backend_url}/api/hello", json=request_data)
-        except HTTPError as e:
-            return request_data, None, str(e)
+    global backend_calls
+
+    backend_calls += 1
+
+    try:
+        response = await get_http_client().post(f"{backend_url}/api/hello", json=request_data)
+    except HTTPError as e:
+        return request_data, None, str(e)
+    finally:
+        backend_calls -= 1
+
+        if backend_calls == 0:
+            backend_calls_done.set()
 
     response_data = response.json()
 
@@ -109,19 +535,73 @@ async def send_greeting(name, text):
 
 @star.route("/api/health", methods=["GET"])
 async def health(request):
+    # Fail readiness checks so no new traffic arrives
+    if drain_event.is_set():
+        return Response("Shutting down\n", 503)
+
     await send_greeting("Testy Tiger", "Hi")
 
     return Response("OK\n", 200)
 
+# Start draining as soon as the signal arrives.  Uvicorn then stops
+# accepting connections and waits for the open ones, which includes
+# the notification streams, so they must end first.
+# sse_starlette patches uvicorn's exit handler to cancel its streams
+# at once, before they can send their last message.  So on the first
+# signal, drain and let the notification streams end before passing
+# the signal on.  A second signal goes straight through.
+class Server(uvicorn.Server):
+    draining = False
+
+    def handle_exit(self, sig, frame):
+        if "main_loop" in globals() and not self.draining:
+            self.draining = True
+            main_loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self.drain_and_exit(sig, frame)))
+            return
+
+        super().handle_exit(sig, frame)
+
+    async def drain_and_exit(self, sig, frame):
+        begin_drain()
+
+        if notification_streams:
+            notification_streams_done.clear()
+
+            try:
+                await asyncio.wait_for(notification_streams_done.wait(), max(0, drain_deadline - main_loop.time()))
+            except asyncio.TimeoutError:
+                pass
+
+        super().handle_exit(sig, frame)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--host", default="0.0.0.0")
     parser.add_argument("--port", type=int, default=8080)
     parser.add_argument("--backend", metavar="URL", default="http://backend:8080")
+    parser.add_argument("--drain-timeout", metavar="SECONDS", type=float, default=drain_timeout,
+                        help="How long to wait for requests in progress at shutdown")
+    parser.add_argument("--rate-limit", metavar="RATE", type=float, default=rate_limit,
+                        help="Greetings allowed per second for each client (0 for no limit)")
+    parser.add_argument("--rate-limit-burst", metavar="COUNT", type=int, default=rate_limit_burst,
+                        help="Greetings a client may send at once before the rate applies")
+    parser.add_argument("--rate-limit-key", choices=("address", "name"), default=rate_limit_key,
+                        help="Tell clients apart by network address or by name")
 
     args = parser.parse_args()
 
     global backend_url
     backend_url = args.backend
+    drain_timeout = args.drain_timeout
+    rate_limit = args.rate_limit
+    rate_limit_burst = args.rate_limit_burst
+    rate_limit_key = args.rate_limit_key
+
+    # Bind the socket before the server starts up, so early
+    # connections wait in the backlog instead of being refused
+    family = socket.AF_INET6 if ":" in args.host else socket.AF_INET
+    sock = socket.create_server((args.host, args.port), family=family, backlog=2048)
+
+    config = uvicorn.Config(star, host=args.host, port=args.port, timeout_graceful_shutdown=drain_timeout)
 
-    uvicorn.run(star, host=args.host, port=args.port)
+    Server(config).run(sockets=[sock])
@@ -0,0 +1,80 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import collections as _collections
+import time as _time
+
+# A token-bucket rate limiter for many clients.  Each client has a
+# bucket of up to burst tokens that refills at rate tokens a second,
+# and each request takes a token.
+#
+# A bucket is just its token count and the time it was last used.  It
+# refills only when it is used again.  A bucket unused for long
+# enough to fill is the same as a new one, so it is dropped.  If there
+# are still more than max_clients buckets, the least recently used
+# ones are dropped, which gives those clients a full bucket early.
+class RateLimiter:
+    def __init__(self, rate, burst, max_clients=10000):
+        assert rate > 0
+        assert burst >= 1
+
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+
+        # Client key -> (tokens, time of last use), least recently
+        # used first
+        self.buckets = _collections.OrderedDict()
+
+    # Returns 0 if the request may go ahead, or otherwise the seconds
+    # until it may
+    def acquire(self, key, now=None):
+        if now is None:
+            now = _time.monotonic()
+
+        # Take out the client's own bucket first, so it doesn't count
+        # against the cap
+        bucket = self.buckets.pop(key, None)
+
+        self._evict(now)
+
+        if bucket is None:
+            tokens = self.burst
+        else:
+            tokens, time = bucket
+            tokens = min(self.burst, tokens + (now - time) * self.rate)
+
+        if tokens >= 1:
+            self.buckets[key] = tokens - 1, now
+            return 0
+
+        self.buckets[key] = tokens, now
+
+        return (1 - tokens) / self.rate
+
+    def _evict(self, now):
+        fill_time = self.burst / self.rate
+
+        while self.buckets:
+            key, (tokens, time) = next(iter(self.buckets.items()))
+
+            if now - time < fill_time and len(self.buckets) < self.max_clients:
+                break
+
+            del self.buckets[key]
@@ -0,0 +1,105 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import heapq as _heapq
+import math as _math
+
+# A streaming quantile sketch in the style of DDSketch.  Each value
+# goes into a bucket whose bounds grow geometrically, so any quantile
+# is within the relative accuracy of the true value.  Adding a value
+# is O(1).  The bucket count is capped, and past the cap the lowest
+# buckets are collapsed together, so memory stays bounded.  Sketches
+# with the same accuracy can be merged.
+class QuantileSketch:
+    def __init__(self, relative_accuracy=0.01, max_buckets=2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = _math.log(self.gamma)
+
+        self.buckets = dict()
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        if value <= 0:
+            self.zero_count += 1
+        else:
+            index = _math.ceil(_math.log(value) / self.log_gamma)
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+
+            if len(self.buckets) > self.max_buckets:
+                self._collapse()
+
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        assert other.relative_accuracy == self.relative_accuracy
+
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+        while len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+
+        rank = q * (self.count - 1)
+
+        if rank < self.zero_count:
+            return 0.0
+
+        seen = self.zero_count
+
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+
+            if seen > rank:
+                # The midpoint of the bucket, in relative terms
+                value = 2 * self.gamma ** index / (1 + self.gamma)
+                return min(max(value, self.min), self.max)
+
+        return self.max
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    # Fold the two lowest buckets into one.  This loses accuracy only
+    # at the low end, which matters least for latency.
+    def _collapse(self):
+        lowest, second = _heapq.nsmallest(2, self.buckets)
+        self.buckets[second] += self.buckets.pop(lowest)
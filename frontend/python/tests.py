@@ -0,0 +1,354 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import gzip
+import json
+import math
+import random
+import time
+
+from plano import *
+
+import ratelimit
+import sketch
+
+# The app tests need the frontend's own dependencies
+try:
+    from starlette.testclient import TestClient
+except ImportError:
+    TestClient = None
+
+frontend_dir = get_parent_dir(get_parent_dir(get_absolute_path(__file__)))
+
+def import_frontend():
+    # The app serves its static files relative to the frontend dir
+    with working_dir(frontend_dir, quiet=True):
+        import main
+
+    return main
+
+def frontend_client():
+    return TestClient(import_frontend().star)
+
+def exact_quantile(values, q):
+    values = sorted(values)
+    return values[math.floor(q * (len(values) - 1))]
+
+def check_quantiles(latencies, values, quantiles=(0, 0.25, 0.5, 0.9, 0.99, 1)):
+    for q in quantiles:
+        expected = exact_quantile(values, q)
+        actual = latencies.quantile(q)
+
+        assert abs(actual - expected) <= latencies.relative_accuracy * expected, (q, actual, expected)
+
+@test
+def sketch_quantiles():
+    rand = random.Random(1)
+    values = [rand.lognormvariate(-3, 1) for _ in range(10000)]
+    latencies = sketch.QuantileSketch()
+
+    assert latencies.quantile(0.5) is None
+    assert latencies.mean is None
+
+    for value in values:
+        latencies.add(value)
+
+    check_quantiles(latencies, values)
+
+    assert latencies.count == len(values), latencies.count
+    assert latencies.min == min(values)
+    assert latencies.max == max(values)
+    assert math.isclose(latencies.mean, sum(values) / len(values))
+
+    latencies.add(0)
+
+    assert latencies.quantile(0) == 0.0, latencies.quantile(0)
+
+@test
+def sketch_merge():
+    rand = random.Random(2)
+    values = [rand.uniform(0.001, 1) for _ in range(5000)]
+    whole = sketch.QuantileSketch()
+    left = sketch.QuantileSketch()
+    right = sketch.QuantileSketch()
+
+    for i, value in enumerate(values):
+        whole.add(value)
+        (left if i % 2 else right).add(value)
+
+    left.merge(right)
+
+    assert left.buckets == whole.buckets
+    assert left.count == whole.count, left.count
+    assert left.min == whole.min
+    assert left.max == whole.max
+    assert math.isclose(left.sum, whole.sum)
+
+    check_quantiles(left, values)
+
+    # Merging an empty sketch changes nothing
+    left.merge(sketch.QuantileSketch())
+
+    assert left.count == whole.count, left.count
+    assert left.min == whole.min
+
+@test
+def sketch_collapse():
+    values = [1.1 ** i for i in range(200)]
+    latencies = sketch.QuantileSketch(max_buckets=50)
+
+    for value in values:
+        latencies.add(value)
+
+    assert len(latencies.buckets) == 50, len(latencies.buckets)
+    assert sum(latencies.buckets.values()) == len(values)
+
+    # The lowest buckets were folded together, so only the low
+    # quantiles lose accuracy
+    check_quantiles(latencies, values, quantiles=(0.9, 0.99, 1))
+
+    assert latencies.quantile(0) > values[0] * (1 + latencies.relative_accuracy)
+
+    # Merging collapses too
+    other = sketch.QuantileSketch(max_buckets=50)
+    other.merge(latencies)
+    other.merge(latencies)
+
+    assert len(other.buckets) == 50, len(other.buckets)
+    assert sum(other.buckets.values()) == 2 * len(values)
+
+@test
+def rate_limit_burst():
+    limiter = ratelimit.RateLimiter(2, 3)
+
+    for i in range(3):
+        assert limiter.acquire("a", now=0) == 0, i
+
+    # The Retry-After value is the time to refill one token
+    assert limiter.acquire("a", now=0) == 0.5
+    assert limiter.acquire("a", now=0) == 0.5
+
+    # Other clients have their own buckets
+    assert limiter.acquire("b", now=0) == 0
+
+@test
+def rate_limit_refill():
+    limiter = ratelimit.RateLimiter(2, 3)
+
+    for i in range(3):
+        limiter.acquire("a", now=0)
+
+    assert limiter.acquire("a", now=0.5) == 0
+    assert math.isclose(limiter.acquire("a", now=0.6), 0.4)
+    assert limiter.acquire("a", now=1.0) == 0
+
+    # The bucket refills only up to the burst
+    for i in range(3):
+        assert limiter.acquire("a", now=100) == 0, i
+
+    assert limiter.acquire("a", now=100) > 0
+
+@test
+def rate_limit_eviction():
+    limiter = ratelimit.RateLimiter(1, 2, max_clients=3)
+
+    for key in "abcd":
+        limiter.acquire(key, now=0)
+        limiter.acquire(key, now=0)
+
+    assert len(limiter.buckets) == 3, len(limiter.buckets)
+    assert "a" not in limiter.buckets
+
+    # An evicted client starts over with a full bucket
+    assert limiter.acquire("a", now=0) == 0
+
+    # Using a bucket makes it the most recently used
+    limiter.acquire("c", now=0)
+    limiter.acquire("e", now=0)
+
+    assert list(limiter.buckets) == ["a", "c", "e"], list(limiter.buckets)
+
+    # Buckets unused for long enough to fill are dropped
+    limiter.acquire("f", now=10)
+
+    assert list(limiter.buckets) == ["f"], list(limiter.buckets)
+
+@test
+def run_wan_parameters():
+    plano_file = join(get_parent_dir(get_absolute_path(__file__)), "..", "..", ".plano.py")
+
+    command = PlanoCommand()
+    args = command.parse_args(["-f", plano_file, "run-wan", "--bandwidth", "1000", "--failure-rate", "0.1"])
+    command.init(args)
+
+    bandwidth = command.command_kwargs["bandwidth"]
+    failure_rate = command.command_kwargs["failure_rate"]
+
+    assert bandwidth == 1000 and isinstance(bandwidth, int), repr(bandwidth)
+    assert failure_rate == 0.1 and isinstance(failure_rate, float), repr(failure_rate)
+
+@test
+def ws_illegal_messages():
+    if TestClient is None:
+        skip_test("Starlette is not installed")
+
+    with frontend_client() as client:
+        with client.websocket_connect("/api/ws") as ws:
+            assert ws.receive_json()["type"] == "records"
+            assert ws.receive_json()["type"] == "stats"
+
+            for frame in (b"\x00\x01", "{", "[]", '{"type": "goodbye"}'):
+                if isinstance(frame, bytes):
+                    ws.send_bytes(frame)
+                else:
+                    ws.send_text(frame)
+
+                message = ws.receive_json()
+
+                assert message["type"] == "error", (frame, message)
+
+            ws.send_json({"type": "hello", "id": 1, "name": "Obtuse Ocelot"})
+
+            message = ws.receive_json()
+
+            assert message["type"] == "hello", message
+            assert message["id"] == 1, message
+            assert message["error"], message
+
+@test
+def stats_summary():
+    if TestClient is None:
+        skip_test("Starlette is not installed")
+
+    main = import_frontend()
+
+    main.update_stats({"name": "backend-1", "pod": "pod-1"}, 0.01)
+
+    stats = main.get_stats()
+
+    # Clients share one summary until the stats change
+    assert main.get_stats() is stats
+
+    main.update_stats({"name": "backend-1", "pod": "pod-1"}, 0.02)
+    main.update_stats(None, 0.03)
+
+    new_stats = main.get_stats()
+
+    assert new_stats is not stats
+    assert new_stats["count"] == stats["count"] + 1, new_stats
+    assert new_stats["errors"] == stats["errors"] + 1, new_stats
+
+@test
+def export_ranges():
+    if TestClient is None:
+        skip_test("Starlette is not installed")
+
+    main = import_frontend()
+    main.records[:] = [{"id": x, "time": 100 + x} for x in range(1, 11)]
+
+    def export_ids(query):
+        response = client.get(f"/api/data/export?{query}", headers={"Accept-Encoding": "identity"})
+
+        assert response.status_code == 200, (query, response.status_code)
+        assert "content-encoding" not in response.headers, response.headers
+
+        return [json.loads(x)["id"] for x in response.text.splitlines()]
+
+    try:
+        with frontend_client() as client:
+            assert export_ids("") == list(range(1, 11))
+            assert export_ids("after=7") == [8, 9, 10]
+            assert export_ids("since=105") == [5, 6, 7, 8, 9, 10]
+            assert export_ids("until=103") == [1, 2, 3]
+            assert export_ids("after=2&since=101&until=105") == [3, 4, 5]
+            assert export_ids("since=200") == []
+
+            for query in ("after=x", "since=x", "until=x"):
+                response = client.get(f"/api/data/export?{query}")
+
+                assert response.status_code == 400, (query, response.status_code)
+                assert "error" in response.json(), response.json()
+    finally:
+        main.records.clear()
+
+@test
+def export_gzip():
+    if TestClient is None:
+        skip_test("Starlette is not installed")
+
+    main = import_frontend()
+    main.records[:] = [{"id": x, "time": 100 + x, "text": "Bon jour"} for x in range(1, 2501)]
+
+    def export(encoding):
+        with client.stream("GET", "/api/data/export", headers={"Accept-Encoding": encoding}) as response:
+            return response.headers.get("content-encoding"), b"".join(response.iter_raw())
+
+    try:
+        with frontend_client() as client:
+            assert export("identity") == (None, "".join(json.dumps(x) + "\n" for x in main.records).encode())
+
+            encoding, data = export("gzip")
+
+            assert encoding == "gzip", encoding
+            assert gzip.decompress(data) == export("identity")[1]
+
+            assert export("gzip;q=0")[0] is None
+            assert export("br, gzip; q=0.5")[0] == "gzip"
+    finally:
+        main.records.clear()
+
+@test
+def accept_encoding():
+    if TestClient is None:
+        skip_test("Starlette is not installed")
+
+    main = import_frontend()
+
+    for header, expected in (("", False),
+                             ("gzip", True),
+                             ("deflate, GZIP;q=0.2", True),
+                             ("gzip;q=0", False),
+                             ("gzip; q=0.0, deflate", False),
+                             ("x-nogzip", False),
+                             ("*", True),
+                             ("*;q=0", False),
+                             ("gzip;q=0, *", False),
+                             ("gzip;q=x", False)):
+        assert main.accepts_gzip(header) is expected, (header, expected)
+
+@test
+def record_time():
+    if TestClient is None:
+        skip_test("Starlette is not installed")
+
+    main = import_frontend()
+
+    try:
+        assert abs(main.get_record_time() - time.time()) < 1
+
+        # A wall clock behind the last record doesn't go back
+        main.records.append({"id": 1, "time": time.time() + 3600})
+
+        assert main.get_record_time() == main.records[-1]["time"]
+    finally:
+        main.records.clear()
+
+if __name__ == "__main__":
+    import sys
+    run_tests(sys.modules[__name__])
@@ -426,44 +426,195 @@ export class Router {
 // One column: [title, key, renderFunction (optional)]
 // renderFunction: render(value, record, context) => value or elem
 // Context is whatever the user chooses to pass into update()
+//
+// Options:
+//   key: keyFunction(record) => key, used by prepend() to skip
+//     records already in the table
+//   windowSize: Past this many records, render only the rows around
+//     the scroll position, with spacers for the rest (default 200)
 export class Table {
-    constructor(id, columns) {
+    constructor(id, columns, options) {
         this.id = id;
         this.columns = columns;
+        this.keyFunction = nvl(options, {}).key;
+        this.windowSize = nvl(nvl(options, {}).windowSize, 200);
+
+        this.records = [];
+        this.keys = new Set();
+        this.context = null;
+
+        this.elem = null;
+        this.tbody = null;
+        this.rowHeight = null;
+        this.firstIndex = 0;
+        this.lastIndex = 0;
+        this.renderPending = false;
     }
 
     update(records, context) {
-        const headings = [];
-        const rows = [];
-        const div = createDiv(null, `#${this.id}`);
+        this.records = Array.from(records);
+        this.context = context;
+        this.keys = new Set(this.keyFunction ? this.records.map(this.keyFunction) : []);
 
-        for (const column of this.columns) {
-            headings.push(column[0]);
+        this.render();
+    }
+
+    // Add records to the top of the table, in the order given
+    prepend(records, context) {
+        if (context !== undefined) {
+            this.context = context;
         }
 
-        for (const record of records) {
-            const row = [];
+        const added = [];
 
-            for (const column of this.columns) {
-                const key = column[1];
-                const renderFunction = column[2];
-                const value = record[key];
+        for (const record of records) {
+            if (this.keyFunction) {
+                const key = this.keyFunction(record);
 
-                if (renderFunction) {
-                    row.push(renderFunction(value, record, context));
-                } else {
-                    row.push(value);
+                if (this.keys.has(key)) {
+                    continue;
                 }
+
+                this.keys.add(key);
             }
 
-            rows.push(row);
+            added.push(record);
+        }
+
+        if (added.length === 0) {
+            return;
         }
 
-        if (rows.length) {
-            createTable(div, headings, rows);
+        this.records = added.concat(this.records);
+
+        if (this.tbody === null || !this.elem.isConnected || this.records.length > this.windowSize) {
+            // Keep the rows in view in place, unless we're at the top
+            if (this.elem !== null && this.elem.scrollTop > 0 && this.rowHeight) {
+                this.render(this.elem.scrollTop + added.length * this.rowHeight);
+            } else {
+                this.render();
+            }
+
+            return;
         }
 
-        $(`#${this.id}`).replaceWith(div);
+        const firstRow = this.tbody.firstChild;
+
+        for (const record of added) {
+            this.tbody.insertBefore(this.renderRow(record), firstRow);
+        }
+    }
+
+    render(scrollTop) {
+        if (this.elem === null || !this.elem.isConnected) {
+            this.elem = createDiv(null, `#${this.id}`);
+            this.elem.addEventListener("scroll", () => this.scheduleRender());
+
+            $(`#${this.id}`).replaceWith(this.elem);
+        }
+
+        scrollTop = nvl(scrollTop, this.elem.scrollTop);
+
+        const count = this.records.length;
+
+        this.tbody = null;
+
+        if (count === 0) {
+            this.elem.replaceChildren();
+            return;
+        }
+
+        const table = createTable(null, this.columns.map(column => column[0]), []);
+        const tbody = table.$("tbody");
+
+        let first = 0;
+        let last = count;
+
+        if (count > this.windowSize) {
+            const rowHeight = nvl(this.rowHeight, 24);
+            const visible = Math.ceil(this.elem.clientHeight / rowHeight);
+            const top = Math.floor(scrollTop / rowHeight);
+
+            first = Math.max(0, Math.min(top - Math.floor((this.windowSize - visible) / 2), count - this.windowSize));
+            last = first + this.windowSize;
+
+            if (first > 0) {
+                this.createSpacer(tbody, first * rowHeight);
+            }
+        }
+
+        for (const record of this.records.slice(first, last)) {
+            tbody.appendChild(this.renderRow(record));
+        }
+
+        if (last < count) {
+            this.createSpacer(tbody, (count - last) * nvl(this.rowHeight, 24));
+        }
+
+        this.elem.replaceChildren(table);
+        this.elem.scrollTop = scrollTop;
+
+        this.tbody = tbody;
+        this.firstIndex = first;
+        this.lastIndex = last;
+
+        // Use the rendered rows to size the spacers next time
+        const rows = last - first;
+
+        if (rows > 0 && this.rowHeight === null) {
+            const height = Array.from(tbody.rows).reduce((sum, tr) => sum + (tr.dataset.spacer ? 0 : tr.offsetHeight), 0);
+
+            if (height > 0) {
+                this.rowHeight = height / rows;
+            }
+        }
+    }
+
+    renderRow(record) {
+        const tr = createElement(null, "tr");
+
+        for (const column of this.columns) {
+            const key = column[1];
+            const renderFunction = column[2];
+            const value = renderFunction ? renderFunction(record[key], record, this.context) : record[key];
+            const td = createElement(tr, "td");
+
+            if (value instanceof Node) {
+                td.appendChild(value);
+            } else {
+                createText(td, value);
+            }
+        }
+
+        return tr;
+    }
+
+    createSpacer(tbody, height) {
+        const tr = createElement(tbody, "tr", {data_spacer: "1"});
+        const td = createElement(tr, "td", {colspan: this.columns.length});
+
+        tr.style.height = `${height}px`;
+        td.style.padding = "0";
+    }
+
+    // Render again only when the view leaves the rendered rows
+    scheduleRender() {
+        if (this.records.length <= this.windowSize || this.renderPending || !this.rowHeight) {
+            return;
+        }
+
+        this.renderPending = true;
+
+        window.requestAnimationFrame(() => {
+            this.renderPending = false;
+
+            const top = Math.floor(this.elem.scrollTop / this.rowHeight);
+            const bottom = top + Math.ceil(this.elem.clientHeight / this.rowHeight);
+
+            if (top < this.firstIndex || bottom > this.lastIndex) {
+                this.render();
+            }
+        });
     }
 }
 
@@ -20,7 +20,10 @@ const html = `
         </div>
       </form>
 
-      <div id="hello-table"></div>
+      <div class="tables">
+        <div id="hello-table"></div>
+        <div id="stats-table"></div>
+      </div>
     </div>
   </section>
   <footer>
@@ -51,8 +54,173 @@ function renderResponse(value, record, context) {
 const helloTable = new gesso.Table("hello-table", [
     ["Frontend", "request", renderRequest],
     ["Backend", "response", renderResponse],
+], {key: record => record.id});
+
+function renderBackend(value, record, context) {
+    const elem = gesso.createElement(null, "div");
+
+    gesso.createSpan(elem, "name", record.name);
+
+    if (record.pod) {
+        gesso.createText(elem, ` (${record.pod})`);
+    }
+
+    return elem;
+}
+
+function renderShare(value, record, context) {
+    return `${Math.round(value * 100)}%`;
+}
+
+function renderLatency(value, record, context) {
+    return value.p50 === null ? "-" : `${value.p50} / ${value.p99} ms`;
+}
+
+const statsTable = new gesso.Table("stats-table", [
+    ["Backend", "name", renderBackend],
+    ["Greetings", "count"],
+    ["Share", "share", renderShare],
+    ["Latency p50 / p99", "latency", renderLatency],
 ]);
 
+// Greetings and record updates go over one WebSocket connection when
+// the server supports it.  Otherwise, greetings are posted, and
+// notifications trigger a fetch of the records added since the last
+// one shown.
+class Transport {
+    constructor(router) {
+        this.router = router;
+        this.socket = null;
+        this.records = null;
+        this.stats = null;
+        this.fallback = false;
+        this.nextRequestId = 0;
+        this.lastRecordId = 0;
+
+        this.connect();
+    }
+
+    connect() {
+        const url = new URL("/api/ws", window.location);
+        url.protocol = url.protocol === "https:" ? "wss:" : "ws:";
+
+        const socket = new WebSocket(url);
+        let opened = false;
+
+        socket.onopen = () => {
+            console.log("Connected to", url.href);
+
+            opened = true;
+            this.socket = socket;
+        };
+
+        socket.onmessage = event => {
+            this.receive(JSON.parse(event.data));
+        };
+
+        socket.onclose = () => {
+            this.socket = null;
+            this.records = null;
+            this.stats = null;
+
+            if (opened) {
+                // Reconnect after a drop, such as an idle timeout
+                setTimeout(() => this.connect(), 1000);
+            } else {
+                this.startFallback();
+            }
+        };
+    }
+
+    startFallback() {
+        if (this.fallback) {
+            return;
+        }
+
+        console.log("WebSocket unavailable; falling back to POST and notifications");
+
+        this.fallback = true;
+
+        new EventSource("/api/notifications").onmessage = event => {
+            this.fetchNewRecords();
+        };
+
+        this.withPage(page => page.updateContent());
+    }
+
+    receive(message) {
+        if (message.type === "records") {
+            this.records = message.records;
+            this.noteRecords(message.records);
+            this.withPage(page => page.updateContent());
+        } else if (message.type === "record") {
+            this.records.push(message.record);
+            this.noteRecords([message.record]);
+            this.withPage(page => page.addRecords([message.record]));
+        } else if (message.type === "stats") {
+            this.stats = message.stats;
+            this.withPage(page => page.updateStats(message.stats));
+        } else if (message.type === "error") {
+            console.log(message.error);
+        }
+    }
+
+    withPage(pageFunction) {
+        if (this.router.page && this.router.page.name) {
+            pageFunction(this.router.page);
+        }
+    }
+
+    noteRecords(records) {
+        for (const record of records) {
+            this.lastRecordId = Math.max(this.lastRecordId, record.id);
+        }
+    }
+
+    fetchNewRecords() {
+        gesso.fetchJSON(`/api/data?after=${this.lastRecordId}`, responseData => {
+            this.noteRecords(responseData);
+            this.withPage(page => page.addRecords(responseData));
+        });
+
+        gesso.fetchJSON("/api/stats", responseData => {
+            this.withPage(page => page.updateStats(responseData));
+        });
+    }
+
+    sayHello(name, text) {
+        const requestData = {
+            text: text,
+            name: name,
+        };
+
+        if (this.socket) {
+            this.socket.send(JSON.stringify({type: "hello", id: this.nextRequestId++, ...requestData}));
+        } else {
+            gesso.postJSON("/api/hello", requestData);
+        }
+    }
+
+    fetchRecords(responseDataHandler) {
+        if (this.records) {
+            responseDataHandler(this.records);
+        } else {
+            gesso.fetchJSON("/api/data", responseData => {
+                this.noteRecords(responseData);
+                responseDataHandler(responseData);
+            });
+        }
+    }
+
+    fetchStats(responseDataHandler) {
+        if (this.stats) {
+            responseDataHandler(this.stats);
+        } else {
+            gesso.fetchJSON("/api/stats", responseDataHandler);
+        }
+    }
+}
+
 class MainPage extends gesso.Page {
     constructor(router) {
         super(router, "/", html);
@@ -60,10 +228,7 @@ class MainPage extends gesso.Page {
         this.body.$("#hello-form").addEventListener("submit", event => {
             event.preventDefault();
 
-            gesso.postJSON("/api/hello", {
-                text: `Hello! I am ${this.name}.`,
-                name: this.name,
-            });
+            transport.sayHello(this.name, `Hello! I am ${this.name}.`);
         });
     }
 
@@ -85,18 +250,28 @@ class MainPage extends gesso.Page {
     updateContent() {
         $("#name").textContent = this.name;
 
-        gesso.fetchJSON("/api/data", responseData => {
+        transport.fetchRecords(responseData => {
             const responses = Object.values(responseData).reverse();
 
             helloTable.update(responses, responseData);
         });
+
+        transport.fetchStats(responseData => {
+            this.updateStats(responseData);
+        });
+    }
+
+    // The records are oldest first, and the newest go at the top
+    addRecords(records) {
+        helloTable.prepend(Object.values(records).reverse());
+    }
+
+    updateStats(stats) {
+        statsTable.update(stats.backends, stats);
     }
 }
 
 const router = new gesso.Router();
+const transport = new Transport(router);
 
 new MainPage(router);
-
-new EventSource("/api/notifications").onmessage = event => {
-    router.page.updateContent();
-};